@@ -0,0 +1,93 @@
+import contextlib
+import os
+import pathlib
+import sys
+import time
+
+from docopt import docopt
+
+import calc_pl
+from coincalcurator.calculrator import Calculator
+from coincalcurator.rowlog import RowLogger
+from coincalcurator.total_average import TotalAverageEngine
+from .synthetic import ledger, pnl_doc, rate_graph
+
+
+def generate(n: int, seed: int, graph) -> int:
+    """ledger only, to subtract from the other rows"""
+    return sum(1 for _ in ledger(n, seed))
+
+
+def ma(n: int, seed: int, graph) -> int:
+    calculator = Calculator(graph)
+    return sum(1 for doc in ledger(n, seed) if calculator.calculate_ma(doc))
+
+
+def ma2(n: int, seed: int, graph) -> int:
+    calculator = Calculator(graph)
+    return sum(1 for doc in ledger(n, seed) if calculator.calculate_ma2(doc))
+
+
+def ga(n: int, seed: int, graph) -> int:
+    engine = TotalAverageEngine(Calculator(graph))
+    for doc in ledger(n, seed):
+        engine.feed(doc)
+    return sum(1 for _ in engine.results())
+
+
+def calc_pl_calculator(n: int, seed: int, graph) -> calc_pl.Calculator:
+    calculator = calc_pl.Calculator('vwap', calc_pl.RateOracle('vwap', graph=graph))
+    for doc in ledger(n, seed):
+        calculator.add(pnl_doc(doc))
+    return calculator
+
+
+def calc_pl_move(n: int, seed: int, graph) -> int:
+    calculator = calc_pl_calculator(n, seed, graph)
+    calculator.export_move(RowLogger('quiet'))
+    return len(calculator.q)
+
+
+def calc_pl_gross(n: int, seed: int, graph) -> int:
+    calculator = calc_pl_calculator(n, seed, graph)
+    calculator.export_gross()
+    return len(calculator.q)
+
+
+METHODS = dict(generate=generate, ma=ma, ma2=ma2, ga=ga, calc_pl_move=calc_pl_move, calc_pl_gross=calc_pl_gross)
+
+
+def main():
+    args = docopt("""
+    Usage:
+        {f} [options]
+
+    Options:
+        --sizes SIZES  numbers of documents  [default: 10000,100000,1000000]
+        --methods METHODS  [default: {methods}]
+        --seed SEED  [default: 0]
+
+    Time calculate_ma, calculate_ma2, calculate_ga_prepare + calculate_ga and the calc_pl exports
+    over synthetic ledgers, with rates from an in-memory RateGraph instead of MongoDB.
+    Every row includes generating its ledger, the generate row is that part alone.
+    """.format(f=pathlib.Path(sys.argv[0]).name, methods=','.join(METHODS)))
+    sizes = [int(x) for x in args['--sizes'].split(',')]
+    methods = args['--methods'].split(',')
+    for method in methods:
+        assert method in METHODS, (method, list(METHODS))
+    seed = int(args['--seed'])
+    graph = rate_graph()
+    graph.resolve()
+    print('{:<14} {:>9} {:>9} {:>10} {:>10}'.format('method', 'docs', 'results', 'seconds', 'docs/s'))
+    for n in sizes:
+        for method in methods:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                results = METHODS[method](n, seed, graph)
+                seconds = time.perf_counter() - start
+            print('{:<14} {:>9,} {:>9,} {:>10.3f} {:>10,.0f}'.format(method, n, results, seconds, n / seconds))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import pathlib
+import statistics
+import subprocess
+import sys
+
+from docopt import docopt
+
+SCRIPTS = (
+    'asset',
+    'calc_pl',
+    'calculate',
+    'convert_data',
+    'convert_rate_to_candle',
+    'convert_rate_to_m1_candle',
+    'import_data',
+    'import_rate',
+)
+
+CODE = """
+import time
+start = time.perf_counter()
+{eager}
+import {script}
+print(time.perf_counter() - start)
+"""
+
+EAGER = """
+import importlib
+import coinapi
+for name in coinapi.EXCHANGES:
+    importlib.import_module('coinapi.' + name)
+"""
+
+
+def measure(script: str, eager: bool, repeat: int):
+    code = CODE.format(script=script, eager=EAGER if eager else '')
+    root = pathlib.Path(__file__).absolute().parent.parent
+    seconds = []
+    for _ in range(repeat):
+        res = subprocess.run([sys.executable, '-c', code], cwd=str(root),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if res.returncode:
+            return None, res.stderr.strip().splitlines()[-1]
+        seconds.append(float(res.stdout.strip().splitlines()[-1]))
+    return statistics.median(seconds), ''
+
+
+def main():
+    args = docopt("""
+    Usage:
+        {f} [options] [SCRIPT...]
+
+    Options:
+        --repeat N  [default: 5]
+
+    Measure the import time of each CLI script, with every exchange module of coinapi
+    imported up front (eager, the old behaviour) and with lazy loading.
+    """.format(f=pathlib.Path(sys.argv[0]).name))
+    repeat = int(args['--repeat'])
+    scripts = args['SCRIPT'] or SCRIPTS
+    print('{:<28} {:>10} {:>10}'.format('script', 'eager[s]', 'lazy[s]'))
+    for script in scripts:
+        row = [script]
+        errors = []
+        for eager in (True, False):
+            seconds, error = measure(script, eager, repeat)
+            row.append('-' if seconds is None else '{:.3f}'.format(seconds))
+            if error:
+                errors.append(error)
+        print('{:<28} {:>10} {:>10}'.format(*row))
+        for error in sorted(set(errors)):
+            print('    # {}'.format(error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import cProfile
+import importlib
+import pathlib
+import pstats
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Iterator
+from unittest import mock
+
+from docopt import docopt
+
+from coinapi.ratelimiter import RateLimiter
+from .pages import FIXTURES, Fixture
+
+# cumulative time of these functions, parse includes the record_id hashing of bitfinex
+PROFILE_GROUPS = (
+    ('stub', lambda path, name: path.endswith('pages.py') and name == '__call__'),
+    ('parse', lambda path, name: '/coinapi/' in path and name == 'parse'),
+    ('hash', lambda path, name: name in ('record_id', 'json_hash')),
+    ('convert', lambda path, name: '/coinapi/' in path and name == 'convert_one'),
+    ('bulk', lambda path, name: path.endswith('bulkop.py') and name in ('insert', '__exit__')),
+)
+
+
+class MemoryCursor:
+    def __init__(self, documents: list):
+        self.documents = documents
+
+    def sort(self, keys: list) -> 'MemoryCursor':
+        return MemoryCursor(sorted(self.documents, key=lambda doc: [doc[k] for k, _ in keys]))
+
+    def limit(self, n: int) -> 'MemoryCursor':
+        return MemoryCursor(self.documents[:n] if n else self.documents)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.documents)
+
+
+class MemoryCollection:
+    """the part of a pymongo collection import_data_all and convert_data_all use, kept in a list"""
+
+    def __init__(self):
+        self.documents = []
+
+    def drop(self):
+        self.documents = []
+
+    def create_index(self, *_, **__):
+        pass
+
+    def insert_many(self, documents: list, ordered: bool = True):
+        _ = ordered
+        self.documents.extend(documents)
+
+    def find(self, *_) -> MemoryCursor:
+        return MemoryCursor(self.documents)
+
+
+class Ingest:
+    """import_data_all and convert_data_all of one exchange over a stubbed API and in-memory collections"""
+
+    def __init__(self, exchange: str, n: int, seed: int):
+        self.fixture = FIXTURES[exchange]  # type: Fixture
+        self.client = importlib.import_module('coinapi.{}'.format(exchange)).Client('benchmark', 'benchmark')
+        self.stub = self.fixture.stub(n, seed)
+        self.fixture.install(self.client, self.stub)
+        self.db = defaultdict(MemoryCollection)
+        self.import_seconds = None
+        self.convert_seconds = None
+
+    @property
+    def rows(self) -> int:
+        return len(self.db[self.fixture.collection].documents)
+
+    @property
+    def converted(self) -> int:
+        return len(self.db['converted'].documents)
+
+    def run(self):
+        method = getattr(self.client, self.fixture.method)
+        methods = {self.fixture.collection: [(method, self.fixture.args)]}
+        with mock.patch.object(type(self.client), 'import_data_methods', methods), \
+                mock.patch.object(RateLimiter, 'wait', lambda _: None):
+            start = time.perf_counter()
+            self.client.import_data_all(self.db, None, None, drop=True)
+            self.import_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            self.client.convert_data_all(self.db, None, None, drop=True)
+            self.convert_seconds = time.perf_counter() - start
+
+
+def profile(ingest: Ingest) -> Dict[str, float]:
+    profiler = cProfile.Profile()
+    profiler.runcall(ingest.run)
+    stats = pstats.Stats(profiler)
+    seconds = dict(total=stats.total_tt)
+    for group, match in PROFILE_GROUPS:
+        seconds[group] = sum(ct for (path, _, name), (_, _, _, ct, _) in stats.stats.items()
+                             if match(path.replace('\\', '/'), name))
+    return seconds
+
+
+def main():
+    args = docopt("""
+    Usage:
+        {f} [options]
+
+    Options:
+        --rows N  records served per exchange  [default: 20000]
+        --exchanges EXCHANGES  [default: {exchanges}]
+        --seed SEED  [default: 0]
+
+    Replay synthetic API pages through get_page_items, import_data_all and convert_data_all of each exchange
+    with the ccxt API method replaced by a local stub, RateLimiter sleeps off and in-memory collections.
+    The second table is a cProfile run: cumulative seconds of the page stub, the parse functions
+    (including record_id hashing), record_id, convert_one and BulkOp writes.
+    """.format(f=pathlib.Path(sys.argv[0]).name, exchanges=','.join(FIXTURES)))
+    n = int(args['--rows'])
+    seed = int(args['--seed'])
+    exchanges = args['--exchanges'].split(',')
+    for exchange in exchanges:
+        assert exchange in FIXTURES, (exchange, list(FIXTURES))
+
+    print('{:<10} {:>6} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'exchange', 'pages', 'rows', 'converted', 'import s', 'pages/s', 'rows/s', 'convert/s'))
+    profiles = {}
+    for exchange in exchanges:
+        try:
+            ingest = Ingest(exchange, n, seed)
+        except Exception as e:
+            print('{:<10} {}: {}'.format(exchange, type(e).__name__, e))
+            continue
+        ingest.run()
+        print('{:<10} {:>6,} {:>8,} {:>9,} {:>9.3f} {:>9,.0f} {:>9,.0f} {:>9,.0f}'.format(
+            exchange, ingest.stub.pages, ingest.rows, ingest.converted, ingest.import_seconds,
+            ingest.stub.pages / ingest.import_seconds, ingest.rows / ingest.import_seconds,
+            ingest.rows / ingest.convert_seconds))
+        sys.stdout.flush()
+        profiles[exchange] = profile(Ingest(exchange, n, seed))
+
+    groups = ['total'] + [group for group, _ in PROFILE_GROUPS]
+    print()
+    print('{:<10}'.format('profile') + ''.join('{:>10}'.format(group) for group in groups))
+    for exchange, seconds in profiles.items():
+        print('{:<10}'.format(exchange) + ''.join('{:>10.3f}'.format(seconds[group]) for group in groups))
+
+
+if __name__ == '__main__':
+    main()
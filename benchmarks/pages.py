@@ -0,0 +1,238 @@
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import pytz
+
+from .synthetic import price
+
+
+class PageStub:
+    """
+    stands in for the ccxt API method an import method pages through.
+    serves the records (newest first) the way the exchange pages them and counts the pages served.
+    """
+
+    def __init__(self, records: list, page: Callable[['PageStub', dict], object], size: int = None):
+        self.records = records
+        self.page = page
+        self.size = size
+        self.pages = 0
+        self._positions = {}  # type: Dict[str, Dict[object, int]]
+
+    def position(self, key: str, value) -> int:
+        if key not in self._positions:
+            self._positions[key] = {x[key]: i for i, x in enumerate(self.records)}
+        return self._positions[key][value]
+
+    def __call__(self, params: dict = None):
+        self.pages += 1
+        return self.page(self, params or {})
+
+
+class Fixture:
+    """one import method of an exchange, the API it calls and the synthetic records served to it"""
+
+    def __init__(self, collection: str, method: str, args: list, api: str,
+                 records: Callable[[int, random.Random, List[datetime]], list],
+                 page: Callable[[PageStub, dict], object], size: int = None,
+                 instruments: Dict[str, dict] = None, apis: Dict[str, Callable] = None):
+        self.collection = collection
+        self.method = method
+        self.args = args
+        self.api = api
+        self.records = records
+        self.page = page
+        self.size = size
+        self.instruments = instruments
+        self.apis = apis or {}
+
+    def stub(self, n: int, seed: int = 0, start: datetime = None) -> PageStub:
+        start = start or pytz.UTC.localize(datetime(2017, 1, 1))
+        times = [start + timedelta(minutes=10 * i) for i in range(n)][::-1]
+        return PageStub(self.records(n, random.Random(seed), times), self.page, self.size)
+
+    def install(self, client, stub: PageStub):
+        """route the API calls of client to stub, through CCXTClient's retry wrapper"""
+        if self.instruments:
+            client.instruments = self.instruments
+        for name, fn in dict(self.apis, **{self.api: stub}).items():
+            setattr(client._delegate, name, fn)
+
+
+def bitfinex_records(n: int, r: random.Random, times: List[datetime]) -> list:
+    records = []
+    for i, t in zip(range(n, 0, -1), times):
+        p = price('BTC', t) / price('USD', t)
+        qty = r.uniform(.01, 1)
+        x = r.random()
+        if x < .4:
+            currency, amount = r.choice([('BTC', qty), ('BTC', -qty), ('USD', qty * p), ('USD', -qty * p)])
+            description = 'Exchange {:.8f} BTC for USD @ {:.1f} on wallet Exchange'.format(qty, p)
+        elif x < .8:
+            currency, amount = r.choice([('BTC', -qty * .002), ('USD', -qty * p * .002)])
+            description = 'Trading fees for {:.8f} BTC (BTCUSD) @ {:.1f} on BFX (0.2%) on wallet Exchange'.format(qty, p)
+        elif x < .9:
+            currency, amount = 'BTC', qty
+            description = 'Deposit (BITCOIN) #{} on wallet Exchange'.format(i)
+        else:
+            currency, amount = 'USD', r.uniform(-100, 100)
+            description = 'Position closed @ {:.1f} on wallet Trading'.format(p)
+        records.append(dict(currency=currency, amount='{:.8f}'.format(amount), balance='{:.8f}'.format(qty * 10),
+                            description=description, timestamp='{:.1f}'.format(t.timestamp())))
+    return records
+
+
+def bitfinex_page(stub: PageStub, params: dict) -> list:
+    # until is inclusive, pages overlap by one record
+    i = stub.position('timestamp', params['until']) if 'until' in params else 0
+    return stub.records[i:i + params['limit']]
+
+
+def kraken_records(n: int, r: random.Random, times: List[datetime]) -> list:
+    records = []
+    for i, t in zip(range(n, 0, -1), times):
+        base, pair = r.choice([('BTC', 'XXBTZJPY'), ('ETH', 'XETHZJPY')])
+        vol = r.uniform(.01, 1)
+        cost = vol * price(base, t)
+        records.append(('T{:07d}-BENCH'.format(i),
+                        dict(ordertxid='O{:07d}-BENCH'.format(i), pair=pair, time=t.timestamp(),
+                             type=r.choice(['buy', 'sell']), ordertype='limit', price='{:.5f}'.format(cost / vol),
+                             cost='{:.5f}'.format(cost), fee='{:.5f}'.format(cost * .0026),
+                             vol='{:.8f}'.format(vol), margin='0.00000', misc='')))
+    return records
+
+
+def kraken_page(stub: PageStub, params: dict) -> dict:
+    ofs = params['ofs']
+    return dict(error=[], result=dict(trades=dict(stub.records[ofs:ofs + stub.size]), count=len(stub.records)))
+
+
+def zaif_records(n: int, r: random.Random, times: List[datetime]) -> list:
+    records = []
+    for i, t in zip(range(n, 0, -1), times):
+        amount = r.uniform(.01, 1)
+        records.append((str(i),
+                        dict(currency_pair='btc_jpy', action=r.choice(['bid', 'ask']), amount=amount,
+                             price=round(price('BTC', t)), fee=0, fee_amount=amount * .001,
+                             your_action=r.choice(['bid', 'ask', 'bid', 'ask', 'both']),
+                             bonus=None, timestamp='{:.1f}'.format(t.timestamp()), comment='')))
+    return records
+
+
+def zaif_page(stub: PageStub, params: dict) -> dict:
+    i = params['from']
+    return {'success': 1, 'return': dict(stub.records[i:i + params['limit']])}
+
+
+def quoinex_records(n: int, r: random.Random, times: List[datetime]) -> list:
+    records = []
+    for i, t in zip(range(n, 0, -1), times):
+        p = price('BTC', t)
+        executions = [dict(id=i * 10 + j, quantity='{:.8f}'.format(r.uniform(.01, .1)), price='{:.1f}'.format(p),
+                           taker_side=r.choice(['buy', 'sell']), created_at=int(t.timestamp()) + j)
+                      for j in range(r.randint(1, 3))]
+        filled = sum(float(x['quantity']) for x in executions)
+        records.append(dict(id=i, order_type='limit', quantity='{:.8f}'.format(filled),
+                            filled_quantity='{:.8f}'.format(filled), price=p, status='filled', target='spot',
+                            side=r.choice(['buy', 'sell']), product_id=5, product_code='CASH', funding_currency='JPY',
+                            currency_pair_code='BTCJPY', order_fee='{:.8f}'.format(filled * p * .001),
+                            created_at=int(t.timestamp()), updated_at=int(t.timestamp()), executions=executions))
+    return records
+
+
+def quoinex_page(stub: PageStub, params: dict) -> dict:
+    page, limit = params['page'], params['limit']
+    return dict(models=stub.records[(page - 1) * limit:page * limit],
+                current_page=page, total_pages=max(1, -(-len(stub.records) // limit)))
+
+
+def quoinex_accounts(*_) -> dict:
+    return dict(fiat_accounts=[dict(id=1, currency='JPY')], crypto_accounts=[dict(id=2, currency='BTC')])
+
+
+def coincheck_records(n: int, r: random.Random, times: List[datetime]) -> list:
+    records = []
+    for i, t in zip(range(n, 0, -1), times):
+        qty = r.uniform(.01, 1)
+        cost = qty * price('BTC', t)
+        side = r.choice(['buy', 'sell'])
+        sign = 1 if side == 'buy' else -1
+        records.append(dict(id=i, order_id=i * 2, created_at=t.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                            funds=dict(btc='{:.8f}'.format(sign * qty), jpy='{:.3f}'.format(-sign * cost)),
+                            pair='btc_jpy', rate='{:.1f}'.format(cost / qty), fee_currency=None, fee='0.0',
+                            liquidity=r.choice(['T', 'M']), side=side))
+    return records
+
+
+def coincheck_page(stub: PageStub, params: dict) -> dict:
+    # starting_after is exclusive
+    after = params['starting_after']
+    i = 0 if after == sys.maxsize else stub.position('id', after) + 1
+    return dict(success=True, data=stub.records[i:i + params['limit']])
+
+
+def bitflyer_records(n: int, r: random.Random, times: List[datetime]) -> list:
+    records = []
+    for i, t in zip(range(n, 0, -1), times):
+        records.append(dict(id=i, order_id='MCWD{:08d}'.format(i), currency_code='BTC',
+                            amount=round(r.uniform(.01, 1), 8), address='1BENCH', tx_hash=uuid.UUID(int=i).hex,
+                            fee=.0008, additional_fee=r.choice([0, 0, .0001]), status='COMPLETED',
+                            event_date=t.strftime('%Y-%m-%dT%H:%M:%S')))
+    return records
+
+
+def bitflyer_page(stub: PageStub, params: dict) -> list:
+    # before is exclusive
+    i = stub.position('id', params['before']) + 1 if 'before' in params else 0
+    return stub.records[i:i + params['count']]
+
+
+def bitmex_records(n: int, r: random.Random, times: List[datetime]) -> list:
+    records = []
+    for i, t in zip(range(n, 0, -1), times):
+        x = r.random()
+        timestamp = t.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        data = dict(transactID=str(uuid.UUID(int=i)), account=1, currency='XBt', transactStatus='Completed',
+                    address='', tx='', text='', transactTime=timestamp, timestamp=timestamp)
+        if x < .1:
+            data.update(transactType='Deposit', amount=r.randint(10 ** 6, 10 ** 8), fee=0)
+        elif x < .2:
+            data.update(transactType='Withdrawal', amount=-r.randint(10 ** 6, 10 ** 8), fee=r.randint(10 ** 4, 10 ** 5))
+        else:
+            data.update(transactType='RealisedPNL', amount=r.randint(-10 ** 6, 10 ** 6), fee=0)
+        records.append(data)
+    return records
+
+
+def bitmex_page(stub: PageStub, params: dict) -> list:
+    i = params['start']
+    return stub.records[i:i + params['count']]
+
+
+FIXTURES = dict(
+    bitfinex=Fixture('balance_history', 'balance_history', ['USD'], 'privatePostHistory',
+                     bitfinex_records, bitfinex_page),
+    zaif=Fixture('execution', 'executions', ['BTC/JPY'], 'privatePostTradeHistory', zaif_records, zaif_page,
+                 instruments={'BTC/JPY': dict(id='btc_jpy', base='BTC', quote='JPY', future=False,
+                                              info=dict(currency_pair='btc_jpy'))}),
+    # kraken returns 50 items a page whatever the limit
+    kraken=Fixture('execution', 'executions_all', [], 'privatePostTradesHistory', kraken_records, kraken_page,
+                   size=50,
+                   instruments={'BTC/JPY': dict(id='XXBTZJPY', base='BTC', quote='JPY',
+                                                info=dict(base='XXBT', quote='ZJPY')),
+                                'ETH/JPY': dict(id='XETHZJPY', base='ETH', quote='JPY',
+                                                info=dict(base='XETH', quote='ZJPY'))}),
+    quoinex=Fixture('order', 'orders_all', [], 'privateGetOrders', quoinex_records, quoinex_page,
+                    instruments={'BTC/JPY': dict(id='5', base='BTC', quote='JPY')},
+                    apis=dict(privateGetAccounts=quoinex_accounts)),
+    coincheck=Fixture('btc_execution', 'btc_executions', [], 'privateGetExchangeOrdersTransactionsPagination',
+                      coincheck_records, coincheck_page,
+                      instruments={'BTC/JPY': dict(id='btc_jpy', base='BTC', quote='JPY')}),
+    bitflyer=Fixture('crypto_withdrawal', 'crypto_withdrawals_all', [], 'privateGetGetcoinouts',
+                     bitflyer_records, bitflyer_page),
+    bitmex=Fixture('wallet_history', 'wallet_history_all', [], 'privateGetUserWallethistory',
+                   bitmex_records, bitmex_page),
+)
@@ -0,0 +1,56 @@
+import pathlib
+import sys
+import time
+
+from docopt import docopt
+
+from coincalcurator.report import PnlReport
+from .synthetic import CandleRateCalculator, ledger
+
+CASES = (
+    (),
+    ('monthly',),
+    ('daily',),
+    ('hourly',),
+    ('hourly', 'daily', 'monthly'),
+)
+
+
+def run(docs, granularities) -> tuple:
+    """the loop of calculate.py ma: the report is fed before each document"""
+    calculator = CandleRateCalculator()
+    report = PnlReport(calculator, granularities)
+    pnl = .0
+    rows = 0
+    start = time.perf_counter()
+    for doc in docs:
+        rows += len(report.feed(doc['time'], pnl))
+        result = calculator.calculate_ma(doc)
+        if result:
+            pnl = result['pnl']
+    return pnl, rows, time.perf_counter() - start
+
+
+def main():
+    args = docopt("""
+    Usage:
+        {f} [options]
+
+    Options:
+        -n N  number of documents  [default: 20000]
+
+    Run calculate_ma over a synthetic ledger with PnlReport of each set of granularities
+    and check that the pnl does not depend on them, the report must not change the calculation.
+    """.format(f=pathlib.Path(sys.argv[0]).name))
+    docs = list(ledger(int(args['-n'])))
+    results = [(granularities,) + run(docs, granularities) for granularities in CASES]
+    print('{:<22} {:>8} {:>10} {:>10} {:>18}'.format('report', 'rows', 'seconds', 'docs/s', 'pnl'))
+    for granularities, pnl, rows, seconds in results:
+        print('{:<22} {:>8,} {:>10.3f} {:>10,.0f} {:>18,.3f}'.format(
+            ','.join(granularities) or '-', rows, seconds, len(docs) / seconds, pnl))
+    pnls = {pnl for _, pnl, _, _ in results}
+    assert len(pnls) == 1, 'pnl depends on the report: {}'.format(sorted(pnls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import os
+import pathlib
+import sys
+import time
+
+from docopt import docopt
+
+from coincalcurator.rowlog import RowLogger, has_debt
+from .synthetic import StaticRateCalculator, ledger
+
+CASES = (
+    ('full', 1, False),
+    ('summary', 1, False),
+    ('full', 100, False),
+    ('full', 1, True),
+    ('quiet', 1, False),
+)
+
+
+def run(docs, row_logger: RowLogger) -> float:
+    calculator = StaticRateCalculator()
+    start = time.perf_counter()
+    for i, doc in enumerate(docs, 1):
+        result = calculator.calculate_ma(doc)
+        if not result:
+            continue
+        row_logger.row(i, '# pnl={:,.3f}  delta={:,.3f}'.format(result['pnl'], result['pnl_delta']), result,
+                       negative=lambda: has_debt(result))
+    return time.perf_counter() - start
+
+
+def main():
+    args = docopt("""
+    Usage:
+        {f} [options]
+
+    Options:
+        -n N  number of documents  [default: 20000]
+        --stdout  print rows to stdout instead of /dev/null
+
+    Run calculate_ma over a synthetic ledger with each RowLogger setting
+    (level, every Nth row, negative balances only).
+    """.format(f=pathlib.Path(sys.argv[0]).name))
+    docs = list(ledger(int(args['-n'])))
+    with open(os.devnull, 'w') as devnull:
+        stream = sys.stdout if args['--stdout'] else devnull
+        rows = []
+        for level, every, negative_only in CASES:
+            seconds = run(docs, RowLogger(level, every, negative_only, stream))
+            rows.append((level, every, negative_only, seconds))
+    print('{:<8} {:>6} {:>9} {:>10} {:>10}'.format('level', 'every', 'negative', 'seconds', 'docs/s'))
+    for level, every, negative_only, seconds in rows:
+        print('{:<8} {:>6} {:>9} {:>10.3f} {:>10,.0f}'.format(
+            level, every, str(negative_only), seconds, len(docs) / seconds))
+
+
+if __name__ == '__main__':
+    main()
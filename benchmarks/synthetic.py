@@ -0,0 +1,172 @@
+import itertools
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Generator, Iterator
+
+import numpy as np
+import pytz
+
+from coincalcurator.calculrator import Calculator, JST
+from coincalcurator.rategraph import Edge, RateGraph, day_of
+
+PRICES = {
+    'JPY': 1.0,
+    'AUD': 85.0,
+    'CNY': 17.0,
+    'EUR': 130.0,
+    'HKD': 14.0,
+    'IDR': .008,
+    'INR': 1.7,
+    'PHP': 2.2,
+    'SGD': 82.0,
+    'USD': 110.0,
+    'BTC': 1000000.0,
+    'BCH': 150000.0,
+    'ETH': 50000.0,
+    'QASH': 100.0,
+    'XMR': 20000.0,
+    'XRP': 50.0,
+    'JPYZ': 1.0,
+    'MONA': 500.0,
+    'PEPECASH': 5.0,
+    'XEM': 50.0,
+    'ZAIF': 1.0,
+    'ERC20.CMS': 10.0,
+}
+assert set(PRICES) == Calculator.SUPPORTED_CURRENCIES
+# every crypto currency against its quote, a few against BTC and BTC against every fiat currency
+INSTRUMENTS = tuple(sorted(
+    ['{}/{}'.format(k, v['quote']) for k, v in Calculator.CRYPTO_CURRENCIES.items()] +
+    ['ETH/BTC', 'BCH/BTC', 'XRP/BTC', 'MONA/BTC'] +
+    ['BTC/{}'.format(k) for k in Calculator.FIAT_CURRENCIES if k not in ('JPY', 'USD')]))
+EXCHANGES = ('bitflyer', 'quoinex', 'zaif', 'bitfinex', 'bitmex', 'kraken', 'coincheck')
+CRYPTO_CURRENCIES = sorted(Calculator.CRYPTO_CURRENCIES)
+
+
+def price(currency: str, dt: datetime) -> float:
+    days = dt.timestamp() / 86400
+    return PRICES[currency] * (1 + .2 * math.sin(days / 30 + len(currency)))
+
+
+class StaticRateCalculator(Calculator):
+    """Calculator with rates from a formula instead of MongoDB, one rate per JST day like get_rate"""
+
+    def get_rate(self, currency: str, dt: datetime):
+        return price(currency, dt.astimezone(JST).replace(hour=0, minute=0, second=0, microsecond=0))
+
+
+class CandleRateCalculator(Calculator):
+    """
+    Calculator with candle lookups from a formula instead of MongoDB. they change with the UTC day
+    like the daily candles, so rates go through the per JST day cache of get_rate.
+    """
+
+    def get_fiat_rate(self, currency: str, dt: datetime):
+        return price(currency, dt.astimezone(pytz.UTC).replace(hour=0, minute=0, second=0, microsecond=0))
+
+    def get_crypto_rate(self, currency: str, dt: datetime):
+        return price(currency, dt.astimezone(pytz.UTC).replace(hour=0, minute=0, second=0, microsecond=0))
+
+
+def rate_graph(start: datetime = None, days: int = 400) -> RateGraph:
+    """in-memory RateGraph of one X/JPY edge per currency, daily prices from two days before start"""
+    start = (start or pytz.UTC.localize(datetime(2017, 1, 1))).astimezone(JST)
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=2)
+    first = day_of(start)
+    edges = []
+    for currency in sorted(PRICES):
+        if currency == 'JPY':
+            continue
+        values = [price(currency, start + timedelta(days=i)) for i in range(days)]
+        edges.append(Edge(currency, 'JPY', 'synthetic.{}/JPY'.format(currency), 'next',
+                          np.arange(first, first + days), np.array(values)))
+    return RateGraph(edges)
+
+
+def ledger(n: int, seed: int = 0, start: datetime = None) -> Iterator[dict]:
+    """
+    n documents of the pl collection format across a few exchanges and all supported currencies:
+    jpy deposits, deposits, withdrawals, withdrawal fees, margin pnl, spot trades and spot fees.
+    quantities are kept non-negative per currency.
+    """
+    return itertools.islice(_ledger(n, seed, start), n)
+
+
+def _ledger(n: int, seed: int, start: datetime) -> Generator[dict, None, None]:
+    r = random.Random(seed)
+    t = start or pytz.UTC.localize(datetime(2017, 1, 1))
+    step = timedelta(days=365) / max(n, 1)
+    holdings = dict.fromkeys(PRICES, .0)
+    for i in itertools.count():
+        t += step
+        exchange = r.choice(EXCHANGES)
+        doc = dict(time=t, exchange=exchange, id='{}_{}'.format(exchange, i),
+                   incomes=[], outcomes=[], fees=[])
+        x = r.random()
+        currency = r.choice(CRYPTO_CURRENCIES)
+        if i == 0 or x < .04:
+            qty = float(r.randint(1, 100) * 10000)
+            holdings['JPY'] += qty
+            doc.update(kind='jpy_deposit', incomes=[('JPY', qty)])
+        elif x < .06:
+            qty = 10000 / PRICES[currency] * r.random()
+            holdings[currency] += qty
+            doc.update(kind='deposit', incomes=[(currency, qty)])
+        elif x < .09 and holdings[currency] > 0:
+            qty = holdings[currency] * r.random() * .1
+            fee = -qty * .001
+            holdings[currency] -= qty - fee
+            doc.update(kind='withdrawal', outcomes=[(currency, -qty)], fees=[(currency, fee)])
+        elif x < .10 and holdings[currency] > 0:
+            fee = -holdings[currency] * .0001
+            holdings[currency] += fee
+            doc.update(kind='withdrawal_fee', fees=[(currency, fee)])
+        elif x < .12 and holdings['BTC'] > 0:
+            qty = holdings['BTC'] * r.uniform(-.01, .01)
+            holdings['BTC'] += qty
+            if qty >= 0:
+                doc.update(kind='margin_deposit', incomes=[('BTC', qty)])
+            else:
+                doc.update(kind='margin_withdrawal', outcomes=[('BTC', qty)])
+        else:
+            while True:
+                instrument = r.choice(INSTRUMENTS)
+                base, quote = instrument.split('/')
+                if holdings[base] > 0 or holdings[quote] > 0:
+                    break
+            side = 'SELL' if holdings[base] > 0 and (holdings[quote] <= 0 or r.random() < .45) else 'BUY'
+            p = price(base, t) / price(quote, t)
+            if side == 'BUY':
+                quote_qty = holdings[quote] * r.random() * .2
+                base_qty = quote_qty / p
+                doc.update(incomes=[(base, base_qty)], outcomes=[(quote, -quote_qty)])
+                holdings[base] += base_qty
+                holdings[quote] -= quote_qty
+            else:
+                base_qty = holdings[base] * r.random() * .5
+                quote_qty = base_qty * p
+                doc.update(incomes=[(quote, quote_qty)], outcomes=[(base, -base_qty)])
+                holdings[base] -= base_qty
+                holdings[quote] += quote_qty
+            fee = -quote_qty * .0015
+            holdings[quote] += fee
+            doc.update(kind='spot', instrument=instrument, side=side)
+            if r.random() < .1:
+                # the fee booked by a document of its own
+                yield doc
+                doc = dict(time=t, exchange=exchange, id='{}_{}_fee'.format(exchange, i),
+                           kind='spot_fee', instrument=instrument, side=side,
+                           incomes=[], outcomes=[], fees=[(quote, fee)])
+            else:
+                doc.update(fees=[(quote, fee)])
+        yield doc
+
+
+def pnl_doc(doc: dict) -> dict:
+    """document of the pl collection in the pnl list format of the converted collections calc_pl reads"""
+    pnl = [[c, q, 'income'] for c, q in doc['incomes']] + [[c, q, 'outcome'] for c, q in doc['outcomes']]
+    pnl += [[c, q, 'fee'] for c, q in doc['fees']]
+    converted = {k: v for k, v in doc.items() if k not in ('incomes', 'outcomes', 'fees')}
+    converted.update(pnl=pnl)
+    return converted
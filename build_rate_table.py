@@ -0,0 +1,59 @@
+import logging
+import pathlib
+import sys
+from datetime import datetime, timedelta
+from pprint import pprint
+
+import pymongo
+from docopt import docopt
+
+from coinapi.clientbase import ClientBase
+from coincalcurator.calculrator import Calculator
+from coincalcurator.rategraph import RateGraph
+from coincalcurator.ratetable import COLLECTION, GRAPH, ROUTES, RateTable
+from coindb.bulkop import BulkOp
+
+UTC = ClientBase.UTC
+JST = ClientBase.JST
+utc_now = ClientBase.utc_now
+parse_time = ClientBase.parse_time
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = docopt("""
+    Usage:
+        {f} [options]
+
+    Options:
+        --db DB  [default: tax]
+        --collection COLLECTION  [default: {collection}]
+        --start START  [default: 2017-01-01T00:00]
+        --stop STOP  [default: 2018-01-01T00:00]
+        --rate-graph  rates through the cheapest path of all candle collections instead of the fixed routes
+
+    Build one row per JST day with the JPY rate of each supported currency from the candle collections.
+    The rows of the days from START to STOP are replaced. Rows built with --rate-graph are only read
+    by --rate-graph runs and the others only by runs without it.
+    """.format(f=pathlib.Path(sys.argv[0]).name, collection=COLLECTION))
+    pprint(args)
+    db_client = pymongo.MongoClient()
+    start = parse_time(args['--start'], JST).astimezone(JST).replace(hour=0, minute=0, second=0, microsecond=0)
+    stop = parse_time(args['--stop'], JST)
+
+    calculator = Calculator(RateGraph.discover(db_client) if args['--rate-graph'] else None)
+    source = GRAPH if args['--rate-graph'] else ROUTES
+    collection = db_client[args['--db']][args['--collection']]
+    collection.create_index([('time', 1)], unique=True)
+    collection.delete_many({'time': {'$gte': start, '$lt': stop}})
+    with BulkOp(collection) as bulk_op:
+        day = start
+        while day < stop:
+            row = RateTable.build_row(day, Calculator.SUPPORTED_CURRENCIES, calculator.get_rate, source)
+            print('#{} {}'.format(row['id'], len(row) - 3))
+            bulk_op.insert(row)
+            day = JST.localize(datetime.combine(day.date() + timedelta(days=1), datetime.min.time()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import copy
+import itertools
 import json
 import logging
 import pathlib
@@ -6,14 +7,20 @@ import sys
 from collections import defaultdict, deque
 from datetime import datetime, timedelta
 from pprint import pprint, pformat
-from typing import Sequence, Dict, Tuple, Optional, Union
+from typing import Sequence, List, Optional, Union
 
+import numpy as np
 import pymongo
 from dateutil.relativedelta import relativedelta
 from docopt import docopt
 
 from coinapi.clientbase import ClientBase
+from coincalcurator.fxcalendar import FXCalendar
+from coincalcurator.rategraph import RateGraph
+from coincalcurator.ratetable import COLLECTION as RATE_TABLE, GRAPH, ROUTES, RateTable
+from coincalcurator.rowlog import RowLogger
 from coindb.bulkop import BulkOp
+from coinmetrics import metrics
 
 UTC = ClientBase.UTC
 JST = ClientBase.JST
@@ -21,6 +28,8 @@ utc_now = ClientBase.utc_now
 parse_time = ClientBase.parse_time
 
 RATE_KEY = ''
+# missing minutes further apart than this are read by separate range queries
+RATE_RUN_GAP = timedelta(hours=6)
 
 
 def main():
@@ -38,13 +47,25 @@ def main():
         --start START  [default: 2017-01-01T00:00+09:00]
         --stop STOP  [default: 2018-01-01T00:00+09:00]
         --key KEY  [default: vwap]
+        --log LEVEL  per-document output of move: quiet, summary or full  [default: full]
+        --log-every N  output every Nth document only  [default: 1]
+        --log-negative  output documents leaving a negative balance only
+        -q --quiet  same as --log quiet
+        --rate-graph  rates through the cheapest path of all candle collections instead of the fixed routes
+        --rate-table COLLECTION  daily rates move reads before the candles  [default: {rate_table}]
+        --profile FILE  write cProfile stats of the run to FILE, read with python -m pstats FILE
+        --max-docs N  stop after N documents of move/gross, to profile a slice of the data
 
     """.format(f=pathlib.Path(sys.argv[0]).name,
                start=JST.localize(datetime(2016, 12, 29)),
-               now=utc_now().astimezone(JST)))
+               now=utc_now().astimezone(JST),
+               rate_table=RATE_TABLE))
     global RATE_KEY
     RATE_KEY = args['--key']
     pprint(args)
+    if args['--profile']:
+        metrics.profile(args['--profile'])
+    max_docs = metrics.max_docs(args['--max-docs'])
     db = args['--db']
     collection = args['--collection']
     start_after = parse_time(args['--start']) - timedelta(microseconds=1000)
@@ -62,10 +83,15 @@ def main():
         return check_balance(exchanges, start_after, stop)
     if args['gather']:
         return gather(db, collection, exchanges, start_after, stop)
+    rate_graph = RateGraph.discover() if args['--rate-graph'] else None
+    rate_table = RateTable.load(pymongo.MongoClient()[db][args['--rate-table']],
+                                GRAPH if args['--rate-graph'] else ROUTES)
     if args['move']:
-        return calculate('move', db, collection, exchanges, start_after, stop)
+        return calculate('move', db, collection, exchanges, start_after, stop, RowLogger.from_args(args),
+                         rate_graph, rate_table, max_docs)
     if args['gross']:
-        return calculate('gross', db, collection, exchanges, start_after, stop)
+        return calculate('gross', db, collection, exchanges, start_after, stop,
+                         rate_graph=rate_graph, rate_table=rate_table, max_docs=max_docs)
 
 
 def gen_doc(db: str, collection: str, start_after: datetime, stop: datetime):
@@ -89,6 +115,12 @@ def gen_pnl(db: str, collection: str, start_after: datetime, stop: datetime):
             yield (doc, CURRENCY_MAP.get(currency, currency), qty, note)
 
 
+def to_datetime64(times: Sequence[datetime]) -> np.ndarray:
+    """naive UTC datetime64[us], as datetimes are stored in MongoDB"""
+    return np.array([t.astimezone(UTC).replace(tzinfo=None) if t.tzinfo else t for t in times],
+                    dtype='datetime64[us]')
+
+
 def print_balances(balances):
     balances = copy.deepcopy(balances)
     for k, v in balances.items():
@@ -149,11 +181,13 @@ def gather(db: str, collection: str,
 
 def calculate(calc_type: str, db: str, collection: str,
               exchanges: Sequence[str],
-              start_after: datetime, stop: datetime):
+              start_after: datetime, stop: datetime, row_logger: RowLogger = None,
+              rate_graph: RateGraph = None, rate_table: RateTable = None, max_docs: int = None):
     print('#', exchanges, start_after, stop)
-    calculator = Calculator(RATE_KEY)
+    calculator = Calculator(RATE_KEY, RateOracle(RATE_KEY, graph=rate_graph, table=rate_table))
+    row_logger = row_logger or RowLogger()
 
-    for doc in gen_doc(db, collection, start_after, stop):
+    for doc in itertools.islice(gen_doc(db, collection, start_after, stop), max_docs):
         try:
             if doc['exchange'] not in exchanges:
                 continue
@@ -164,7 +198,7 @@ def calculate(calc_type: str, db: str, collection: str,
             raise
 
     if calc_type == 'move':
-        calculator.export_move()
+        calculator.export_move(row_logger)
     elif calc_type == 'gross':
         calculator.export_gross()
 
@@ -190,14 +224,24 @@ CURRENCY_MAP = {
 }
 
 
-class Calculator:
-    def __init__(self, rate_key: str):
+class RateOracle:
+    """
+    rate lookups shared by Calculator and all of its Balance objects:
+    one MongoDB client, the collections opened on it, one cache of candle rates
+    and the FXCalendar of each daily collection.
+    with a RateGraph, get_rate/get_rates use its paths instead of the fixed routes.
+    a RateTable of daily rates is read first by Balance, Calculator keeps its minute candles.
+    """
+
+    def __init__(self, rate_key: str, db_client: pymongo.MongoClient = None, graph: RateGraph = None,
+                 table: RateTable = None):
         self.rate_key = rate_key
-        self.db_client = pymongo.MongoClient()
+        self.db_client = db_client or pymongo.MongoClient()
+        self.graph = graph
+        self.table = table
         self.collections = {}
         self.cache = {}
-        self.q = deque()
-        self.kinds = set()
+        self.fx_calendars = {}
 
     def get_collection(self, db: str, collection: str):
         key = (db, collection)
@@ -205,24 +249,73 @@ class Calculator:
             self.collections[key] = self.db_client[db][collection]
         return self.collections[key]
 
+    def next_rate(self, db: str, collection: str, dt_base: datetime, key: str = None) -> float:
+        """key (rate_key by default) of the first candle after dt_base"""
+        key = key or self.rate_key
+        cache_key = (db, collection, dt_base, key)
+        metrics.count('rate_oracle.next_rate')
+        if cache_key not in self.cache:
+            target = None
+            with metrics.timer('rate_oracle.query'):
+                for target in self.get_collection(db, collection).find(
+                        {'time': {'$gt': dt_base}}, {'_id': 0, 'time': 1, key: 1}).sort('time', 1).limit(1):
+                    assert key in target, (db, collection, dt_base, target)
+                    self.cache[cache_key] = target[key]
+                    break
+                else:
+                    assert False, (db, collection, dt_base, target)
+        return self.cache[cache_key]
+
+    def next_rates(self, db: str, collection: str, dt_bases: List[datetime], key: str = None) -> List[float]:
+        """
+        next_rate of sorted dt_bases at once.
+        the ones not cached are read by one range query per run of nearby dt_bases.
+        """
+        key = key or self.rate_key
+        metrics.count('rate_oracle.next_rate', len(dt_bases))
+        missing = [dt_base for dt_base in dt_bases if (db, collection, dt_base, key) not in self.cache]
+        if missing:
+            runs = [[missing[0]]]
+            for dt_base in missing[1:]:
+                if dt_base - runs[-1][-1] > RATE_RUN_GAP:
+                    runs.append([])
+                runs[-1].append(dt_base)
+            for run in runs:
+                i = 0
+                with metrics.timer('rate_oracle.query'):
+                    for target in self.get_collection(db, collection).find(
+                            {'time': {'$gt': run[0]}}, {'_id': 0, 'time': 1, key: 1}).sort('time', 1):
+                        assert key in target, (db, collection, run[i], target)
+                        while i < len(run) and run[i] < target['time']:
+                            self.cache[(db, collection, run[i], key)] = target[key]
+                            i += 1
+                        if i == len(run):
+                            break
+                    else:
+                        assert False, (db, collection, run[i])
+        return [self.cache[(db, collection, dt_base, key)] for dt_base in dt_bases]
+
+    def fx_calendar(self, db: str, collection: str) -> FXCalendar:
+        key = (db, collection)
+        if key not in self.fx_calendars:
+            self.fx_calendars[key] = FXCalendar.load(self.get_collection(db, collection))
+        return self.fx_calendars[key]
+
+    def previous_close(self, db: str, collection: str, dt: datetime) -> float:
+        """close of the last daily candle before dt"""
+        return self.fx_calendar(db, collection).close_before(dt)
+
+
+class Calculator:
+    def __init__(self, rate_key: str, rates: RateOracle = None):
+        self.rate_key = rate_key
+        self.rates = rates or RateOracle(rate_key)
+        self.q = deque()
+        self.kinds = set()
+
     def _get_instrument_rate(self, exchange: str, instrument: str, dt: datetime):
-        #        dt_base = (dt - relativedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
         dt_base = (dt - relativedelta(minutes=1)).replace(second=0, microsecond=0)
-        key = (exchange, instrument, dt_base)
-        if key not in self.cache:
-            #            collection = self.get_collection(exchange, '{}'.format(instrument))
-            collection = self.get_collection(exchange, '{}_M1'.format(instrument))
-            #            collection = self.get_collection(exchange, '{}_D'.format(instrument))
-            target = None
-            #            for target in collection.find({'time': {'$lt': dt}}).sort('time', -1):
-            for target in collection.find({'time': {'$gt': dt_base}}).sort('time', 1):
-                #                return target['price']
-                assert target and self.rate_key in target, (exchange, instrument, dt, target)
-                self.cache[key] = target[self.rate_key]
-                break
-            else:
-                assert False, (exchange, instrument, dt, dt_base, target)
-        return self.cache[key]
+        return self.rates.next_rate(exchange, '{}_M1'.format(instrument), dt_base)
 
     def get_fiat_rate(self, currency: str, dt: datetime):
         btc_jpy_rate = self._get_instrument_rate('quoinex', 'BTC/JPY', dt)
@@ -236,22 +329,57 @@ class Calculator:
         return target_rate * quote_rate
 
     def get_rate(self, currency: str, dt: datetime):
+        metrics.count('calc_pl.get_rate')
         if currency in ('bank', 'JPY'):
             return 1.0
+        if self.rates.graph:
+            return self.rates.graph.rate(currency, dt)
         if currency in FIAT_CURRENCIES:
             return self.get_fiat_rate(currency, dt)
         assert currency in CRYPTO_CURRENCIES, (currency, CRYPTO_CURRENCIES)
         return self.get_crypto_rate(currency, dt)
 
+    def _get_instrument_rates(self, exchange: str, instrument: str, times: np.ndarray) -> np.ndarray:
+        """_get_instrument_rate of datetime64 times at once"""
+        bases, index = np.unique((times - np.timedelta64(1, 'm')).astype('datetime64[m]'), return_inverse=True)
+        bases = bases.astype('datetime64[us]').tolist()  # type: List[datetime]
+        rates = self.rates.next_rates(exchange, '{}_M1'.format(instrument), bases)
+        return np.array(rates, dtype=float)[index]
+
+    def get_rates(self, currency: str, times: np.ndarray) -> np.ndarray:
+        """get_rate of datetime64 times at once"""
+        if currency in ('bank', 'JPY'):
+            return np.ones(len(times))
+        if self.rates.graph:
+            return self.rates.graph.rates(currency, times)
+        if currency in FIAT_CURRENCIES:
+            btc_jpy_rates = self._get_instrument_rates('quoinex', 'BTC/JPY', times)
+            return btc_jpy_rates / self._get_instrument_rates('quoinex', 'BTC/{}'.format(currency), times)
+        assert currency in CRYPTO_CURRENCIES, (currency, CRYPTO_CURRENCIES)
+        exchange, quote = CRYPTO_CURRENCIES[currency]
+        target_rates = self._get_instrument_rates(exchange, '{}/{}'.format(currency, quote), times)
+        return target_rates * self.get_rates(quote, times)
+
+    def get_rate_column(self, currencies: Sequence[str], times: Sequence[datetime]) -> np.ndarray:
+        """rates of (currencies[i], times[i]), one get_rates per currency"""
+        currencies = np.array(currencies, dtype=str)
+        times = to_datetime64(times)
+        rates = np.empty(len(currencies))
+        for currency in np.unique(currencies).tolist():
+            mask = currencies == currency
+            rates[mask] = self.get_rates(currency, times[mask])
+        return rates
+
     def append(self, *, kind: str, incomes=(), outcomes=(), fees=(), **kwargs):
         self.q.append(dict(kind=kind, incomes=incomes, outcomes=outcomes, fees=fees, **kwargs))
 
-    def export_move(self):
+    @metrics.timer('calc_pl.export_move')
+    def export_move(self, row_logger: RowLogger):
         simple_balances = defaultdict(float)
-        balances = Balances()
+        balances = Balances(self.rates)
 
         results = []
-        for doc in self.q:
+        for i, doc in enumerate(self.q, 1):
             try:
                 for currency, qty in doc['incomes'] + doc['outcomes'] + doc['fees']:
                     currency = CURRENCY_MAP.get(currency, currency)
@@ -263,7 +391,7 @@ class Calculator:
                 incomes = []
                 outcomes = []
                 fees = []
-                pprint(doc)
+                row_logger.trace(i, doc)
                 if doc_kind in ('spot', 'spot_fee'):
                     instrument = doc['instrument']
                     base, quote = instrument.split('/')
@@ -316,10 +444,10 @@ class Calculator:
                         outcomes.append(balances[currency].calculate(doc_time, outcome, None))
                     for currency, fee in doc['fees']:
                         fees.append(balances[currency].calculate(doc_time, fee, None))
-                print('#after')
-                pprint(incomes)
-                pprint(outcomes)
-                pprint(fees)
+                row_logger.trace(i, '#after')
+                row_logger.trace(i, incomes)
+                row_logger.trace(i, outcomes)
+                row_logger.trace(i, fees)
                 results.append(dict(time=doc_time,
                                     exchange=doc['exchange'],
                                     kind=doc_kind,
@@ -341,11 +469,9 @@ class Calculator:
             for c, bs in result['balances'].items():
                 if bs['qty'] < 0:
                     negative = True
-            print('#{}{}'.format(i, ' negative' if negative else ''))
             for x in result['_incomes'] + result['_outcomes'] + result['_fees']:
                 pl_value += x['value']
-            print('#pnl={:,}'.format(pl_value))
-            pprint(result)
+            row_logger.row(i, '#pnl={:,}'.format(pl_value), result, negative=negative)
 
         print('# balances')
         pprint(balances)
@@ -354,16 +480,14 @@ class Calculator:
         print_balances(simple_balances)
         print('# kinds = {}'.format(list(sorted(self.kinds))))
 
+    @metrics.timer('calc_pl.export_gross')
     def export_gross(self):
-        simple_balances = defaultdict(float)  # type: Dict[str, float]
-        balances_buy = defaultdict(lambda: (.0, .0))  # type: Dict[str, Tuple[float, float]]
-        balances_sell = defaultdict(lambda: (.0, .0))  # type: Dict[str, Tuple[float, float]]
-
-        costs = defaultdict(lambda: (.0, .0))
+        # (currency, qty, rate currency, amount, time): qty and amount * rate are added to the costs of currency
+        costs = []
+        # (currency, amount, time): amount is sold at the rate of time
+        sales = []
         for doc in self.q:
             try:
-                for currency, qty in doc['incomes'] + doc['outcomes'] + doc['fees']:
-                    simple_balances[currency] += qty
                 dt = doc['time']
                 kind = doc['kind']
                 if kind in ('spot', 'spot_fee'):
@@ -376,42 +500,43 @@ class Calculator:
                     if quote in FIAT_CURRENCIES and side == 'BUY':
                         for currency, income in doc['incomes']:
                             assert currency == base
-                            q, v = costs[currency]
-                            costs[currency] = (q + income, v)
+                            costs.append((currency, income, 'JPY', .0, dt))
                         for currency, outcome in doc['outcomes']:
                             assert currency == quote
-                            q, v = costs[base]
-                            costs[base] = (q, v + abs(outcome) * self.get_rate(quote, dt))
+                            costs.append((base, .0, quote, abs(outcome), dt))
                     else:
                         for currency, income in doc['incomes']:
-                            q, v = costs[currency]
-                            costs[currency] = (q + income, v + abs(income) * self.get_rate(currency, dt))
+                            costs.append((currency, income, currency, abs(income), dt))
                 else:
                     for currency, income in doc['incomes']:
-                        q, v = costs[currency]
-                        costs[currency] = (q + income, v + abs(income) * self.get_rate(currency, dt))
+                        costs.append((currency, income, currency, abs(income), dt))
+                for currency, outcome in doc['outcomes']:
+                    sales.append((currency, abs(outcome), dt))
+                for currency, fee in doc['fees']:
+                    if fee:
+                        sales.append((currency, abs(fee), dt))
             except Exception:
                 pprint(doc)
                 raise
 
+        currencies, qty, rate_currencies, amounts, times = list(zip(*costs)) or [()] * 5
+        values = np.array(amounts, dtype=float) * self.get_rate_column(rate_currencies, times)
+        keys, index = np.unique(np.array(currencies, dtype=str), return_inverse=True)
+        qty_sums = np.bincount(index, weights=np.array(qty, dtype=float), minlength=len(keys))
+        value_sums = np.bincount(index, weights=values, minlength=len(keys))
         unit_prices = {}
-        for k, (a, b) in costs.items():
+        for k, a, b in zip(keys.tolist(), qty_sums.tolist(), value_sums.tolist()):
             unit_prices[k] = b / a
 
+        currencies, amounts, times = list(zip(*sales)) or [()] * 3
+        keys, index = np.unique(np.array(currencies, dtype=str), return_inverse=True)
+        missing = set(keys.tolist()) - set(unit_prices)
+        assert not missing, ('no cost', missing)
+        key_prices = np.array([unit_prices[k] for k in keys.tolist()], dtype=float)
+        pl_values = np.array(amounts, dtype=float) * (self.get_rate_column(currencies, times) - key_prices[index])
         balances = defaultdict(float)
-
-        for doc in self.q:
-            try:
-                dt = doc['time']
-                kind = doc['kind']
-                for currency, outcome in doc['outcomes']:
-                    balances[currency] += abs(outcome) * (self.get_rate(currency, dt) - unit_prices[currency])
-                for currency, fee in doc['fees']:
-                    if fee:
-                        balances[currency] += abs(fee) * (self.get_rate(currency, dt) - unit_prices[currency])
-            except Exception:
-                pprint(doc)
-                raise
+        for k, v in zip(keys.tolist(), np.bincount(index, weights=pl_values, minlength=len(keys)).tolist()):
+            balances[k] = v
 
         print('# unit_price')
         pprint(unit_prices)
@@ -477,8 +602,12 @@ class Calculator:
 
 
 class Balances(dict):
+    def __init__(self, rates: RateOracle = None):
+        super().__init__()
+        self.rates = rates or RateOracle(RATE_KEY)
+
     def __missing__(self, key):
-        self[key] = value = Balance(key)
+        self[key] = value = Balance(key, self.rates)
         return value
 
     def json(self):
@@ -489,15 +618,13 @@ class Balances(dict):
 
 
 class Balance(dict):
-    def __init__(self, currency: str):
+    def __init__(self, currency: str, rates: RateOracle):
         super().__init__()
         self.currency = CURRENCY_MAP.get(currency, currency)
         self.qty = 0
         self.value = 0
 
-        self.db_client = pymongo.MongoClient()
-        self.collections = {}
-        self.cache = {}
+        self.rates = rates
 
     @property
     def qty(self):
@@ -522,6 +649,7 @@ class Balance(dict):
             self['unit_price'] = self.value / self.qty
 
     def calculate(self, dt: datetime, qty: Union[int, float], value: Optional[float]):
+        metrics.count('calc_pl.calculate')
         assert isinstance(qty, (float, int))
         pre_qty = self.qty
         pre_value = self.value
@@ -560,33 +688,14 @@ class Balance(dict):
     def ret_data(self, qty, value: Optional[float], note: str):
         return dict(currency=self.currency, qty=qty, value=value, _note=note)
 
-    def get_collection(self, db: str, collection: str):
-        key = (db, collection)
-        if key not in self.collections:
-            self.collections[key] = self.db_client[db][collection]
-        return self.collections[key]
-
     def _get_instrument_rate(self, exchange: str, instrument: str, dt: datetime):
         dt_base = (dt - relativedelta(days=2)).replace(hour=0, minute=0, second=0, microsecond=0)
-        key = (exchange, instrument, dt_base)
-        if key not in self.cache:
-            collection = self.get_collection(exchange, '{}_D'.format(instrument))
-            target = None
-            for target in collection.find({'time': {'$gt': dt_base}}).sort('time', 1):
-                assert target and RATE_KEY in target, (exchange, instrument, dt, target)
-                self.cache[key] = target[RATE_KEY]
-                break
-            else:
-                assert False, (exchange, instrument, dt, dt_base, target)
-        return self.cache[key]
+        return self.rates.next_rate(exchange, '{}_D'.format(instrument), dt_base)
 
     def _get_fiat_instrument_rate(self, exchange: str, instrument: str, dt: datetime):
         if instrument == 'JPY/JPY':
             return 1.0
-        collection = self.get_collection(exchange, instrument)
-        for doc in collection.find({'time': {'$lt': dt - timedelta(days=1)}}).sort('time', -1):
-            return doc['c']
-        assert False
+        return self.rates.previous_close(exchange, instrument, dt - timedelta(days=1))
 
     def get_fiat_rate(self, currency: str, dt: datetime):
         if currency == 'JPY':
@@ -596,16 +705,19 @@ class Balance(dict):
 
     def get_crypto_rate(self, currency: str, dt: datetime):
         db, quote = CRYPTO_CURRENCIES[currency]
-        #   collection = self.get_collection(db, '{}/{}_M1'.format(currency, quote))
-        collection = self.get_collection(db, '{}/{}_D'.format(currency, quote))
         dt_base = (dt - relativedelta(days=2)).replace(hour=0, minute=0, second=0, microsecond=0)
-        for doc in collection.find({'time': {'$gt': dt_base}}).sort('time', 1):
-            return doc['vwap'] * self.get_fiat_rate(quote, dt)
-        assert False
+        target_rate = self.rates.next_rate(db, '{}/{}_D'.format(currency, quote), dt_base, 'vwap')
+        return target_rate * self.get_fiat_rate(quote, dt)
 
     def get_rate(self, currency: str, dt: datetime):
+        metrics.count('calc_pl.get_rate')
         if currency in ('bank', 'JPY'):
             return 1.0
+        rate = self.rates.table.get(currency, dt) if self.rates.table else None
+        if rate is not None:
+            return rate
+        if self.rates.graph:
+            return self.rates.graph.rate(currency, dt)
         if currency in FIAT_CURRENCIES:
             return self.get_fiat_rate(currency, dt)
         assert currency in CRYPTO_CURRENCIES, (currency, CRYPTO_CURRENCIES)
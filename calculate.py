@@ -1,18 +1,33 @@
+import contextlib
 import copy
+import itertools
 import json
 import logging
+import os
 import pathlib
 import sys
 from collections import defaultdict
 from datetime import timedelta, datetime
 from pprint import pprint, pformat
+from typing import Sequence
 
 import pymongo
 from docopt import docopt
 
 from coinapi.clientbase import ClientBase
 from coincalcurator.calculrator import Calculator
+from coincalcurator.columnar import ColumnarWriter, read_rows as read_columnar_rows
+from coincalcurator.journal import PROJECTION, Journal
+from coincalcurator.jsonwriter import json_writer, read_rows as read_json_rows
+from coincalcurator.position import Position
+from coincalcurator.rategraph import RateGraph
+from coincalcurator.ratetable import COLLECTION as RATE_TABLE, GRAPH, ROUTES, RateTable
+from coincalcurator.report import PnlReport
+from coincalcurator.rowlog import RowLogger, has_debt
+from coincalcurator.snapshot import SORT, SORT_KEYS, SnapshotStore, doc_key
+from coincalcurator.total_average import TotalAverageEngine
 from coindb.bulkop import BulkOp
+from coinmetrics import metrics
 
 UTC = ClientBase.UTC
 JST = ClientBase.JST
@@ -23,9 +38,44 @@ parse_time = ClientBase.parse_time
 def support_datetime_default(o):
     if isinstance(o, datetime):
         return o.astimezone(JST).isoformat()
+    if isinstance(o, Position):
+        return o.as_dict()
     raise TypeError(repr(o) + " is not JSON serializable")
 
 
+def output_key(row: dict) -> tuple:
+    """doc_key of the document of an output row, with the id as str like the columnar rows"""
+    t = row['time']
+    if isinstance(t, str):
+        t = parse_time(t)
+    return t, row['exchange'], row['kind'], str(row['id'])
+
+
+def move_aside(path: str) -> str:
+    """rename the output of the previous run to read it while its replacement is written"""
+    assert os.path.exists(path), '--incremental needs {} of the previous run'.format(path)
+    previous = pathlib.Path(path)
+    previous = str(previous.with_name('{}.prev{}'.format(previous.stem, previous.suffix)))
+    os.replace(path, previous)
+    return previous
+
+
+def prefix_rows(rows, keys: set):
+    """rows of the previous output up to the first one of a document not in keys"""
+    for row in rows:
+        if output_key(row) not in keys:
+            return
+        yield row
+
+
+def find_docs(calculator: Calculator, collection, exchanges: Sequence[str], direct: bool,
+              start_after: datetime, stop: datetime, projection: dict = None):
+    if direct:
+        # merge the converted collections of the exchanges on the fly instead of reading pl
+        return calculator.merge_data(exchanges, start_after, stop)
+    return collection.find({'time': {'$gt': start_after, '$lt': stop}}, projection).sort(SORT)
+
+
 def main():
     logging.basicConfig(level=logging.INFO)
     args = docopt("""
@@ -42,11 +92,35 @@ def main():
         --start START  [default: 2017-01-01T00:00]
         --stop STOP  [default: 2018-01-01T00:00]
         --exchanges EXCHANGES
+        --direct  ma_old/ma/ma2/ga read the converted collections of the exchanges instead of --collection
         --balance FILE
+        --format FORMAT  history format of JSON_FILE, json or ndjson  [default: json]
+        --compact  write JSON_FILE without indentation
+        --log LEVEL  per-document output: quiet, summary or full  [default: full]
+        --log-every N  output every Nth document only  [default: 1]
+        --log-negative  output documents leaving a negative balance only
+        -q --quiet  same as --log quiet
+        --snapshot-dir DIR  write snapshots of the ma_old/ma/ma2 state to DIR
+        --snapshot-every N  documents between snapshots  [default: 1000]
+        --resume  continue from the newest snapshot in --snapshot-dir before --start
+        --incremental  continue from the newest snapshot before the first document changed since the last run.
+                       JSON_FILE and --columnar keep their rows of the previous run up to the snapshot
+        --columnar FILE  also write one row per document/currency to FILE as Parquet (.arrow: Arrow IPC)
+        --rate-graph  rates through the cheapest path of all candle collections instead of the fixed routes
+        --rate-table COLLECTION  daily rates read before the candles, see build_rate_table.py  [default: {rate_table}]
+        --report LIST  realised/m2m pnl buckets of ma_old/ma/ma2: hourly, daily and/or monthly  [default: hourly,daily]
+        --profile FILE  write cProfile stats of the run to FILE, read with python -m pstats FILE
+        --max-docs N  stop after N documents of import, simple, ma_old/ma/ma2 and ga, to profile a slice of the data.
+                      import writes to COLLECTION_max_docs instead of COLLECTION, ma_old/ma/ma2/ga
+                      leave the snapshots, the journal and *_result.json as they are
 
-    """.format(f=pathlib.Path(sys.argv[0]).name))
+    """.format(f=pathlib.Path(sys.argv[0]).name, rate_table=RATE_TABLE))
     json_file = args['JSON_FILE']
+    row_logger = RowLogger.from_args(args)
     pprint(args)
+    if args['--profile']:
+        metrics.profile(args['--profile'])
+    max_docs = metrics.max_docs(args['--max-docs'])
     db = args['--db']
     collection = args['--collection']
     start = parse_time(args['--start'], JST)
@@ -62,7 +136,16 @@ def main():
         exchanges = args['--exchanges'].split(',')
     db_client = pymongo.MongoClient()
     collection = db_client[db][collection]
+
+    def new_calculator() -> Calculator:
+        # rates are read by the commands valuing currencies only
+        rate_graph = RateGraph.discover(db_client) if args['--rate-graph'] else None
+        rate_table = RateTable.load(db_client[db][args['--rate-table']], GRAPH if rate_graph else ROUTES)
+        return Calculator(rate_graph, rate_table)
+
     if args['import']:
+        if max_docs:
+            collection = db_client[db][metrics.scratch_name(collection.name)]
         collection.create_index([
             ('time', 1),
             ('exchange', 1),
@@ -71,7 +154,7 @@ def main():
         ], unique=True)
         collection.drop()
         with BulkOp(collection) as bulk_op:
-            for doc in Calculator().import_data(exchanges, start, stop):
+            for doc in itertools.islice(Calculator().import_data(exchanges, start, stop), max_docs):
                 try:
                     bulk_op.insert(doc)
                 except Exception:
@@ -79,7 +162,7 @@ def main():
                     raise
         return
     if args['asset']:
-        calculator = Calculator()
+        calculator = new_calculator()
         with open(args['FILE']) as f:
             data = json.load(f)
         cost = .0
@@ -132,7 +215,7 @@ def main():
         pprint(balances)
         return
     if args['simple']:
-        calculator = Calculator()
+        calculator = new_calculator()
         calculator.reset()
         daily_pnl = .0
         hourly_pnl = .0
@@ -140,7 +223,8 @@ def main():
         daily_stop = None
         hourly_stop = None
         json_data = []
-        for i, doc in enumerate(collection.find({'time': {'$gt': start_after, '$lt': stop}}).sort('time', 1), 1):
+        docs = collection.find({'time': {'$gt': start_after, '$lt': stop}}).sort('time', 1).limit(max_docs or 0)
+        for i, doc in enumerate(docs, 1):
             doc['time'] = t = UTC.localize(doc['time'])
             for currency, qty in doc['incomes']:
                 pnl += calculator.get_rate(currency, t) * qty
@@ -150,168 +234,150 @@ def main():
                 pnl += calculator.get_rate(currency, t) * qty
         print('#pnl={}'.format(pnl))
         return
-    if args['ma_old'] or args['ma']:
-        calculator = Calculator()
+    if args['ma_old'] or args['ma'] or args['ma2']:
+        method = [k for k in ('ma_old', 'ma', 'ma2') if args[k]][0]
+        calculator = new_calculator()
         calculator.reset()
+        calculate = getattr(calculator, 'calculate_{}'.format(method))
         if args['--balance']:
             with open(args['--balance']) as f:
                 balances = json.load(f)
                 calculator.load_balances(balances)
-        daily_pnl = .0
-        hourly_pnl = .0
-        pnl = .0
-        daily_stop = None
-        hourly_stop = None
-        json_data = []
-        for i, doc in enumerate(collection.find({'time': {'$gt': start_after, '$lt': stop}}).sort('time', 1), 1):
-            try:
-                doc['time'] = t = UTC.localize(doc['time'])
-                if daily_stop is None:
-                    daily_stop = t.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-                if hourly_stop is None:
-                    hourly_stop = t.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-                while hourly_stop <= t:
-                    print('# {} hourly_pnl={:,.3f} delta={:,.3f}'.format(
-                        hourly_stop, pnl, pnl - hourly_pnl))
-                    pprint(calculator.get_current_value(hourly_stop - timedelta(hours=1)))
-                    hourly_pnl = pnl
-                    hourly_stop += timedelta(hours=1)
-                while daily_stop <= t:
-                    print('# {} daily_pnl={:,.3f} delta={:,.3f}'.format(
-                        daily_stop, pnl, pnl - daily_pnl))
-                    pprint(calculator.get_current_value(daily_stop - timedelta(days=1)))
-                    daily_pnl = pnl
-                    daily_stop += timedelta(days=1)
-                if args['ma_old']:
-                    result = calculator.calculate_ma_old(doc)
-                elif args['ma']:
-                    result = calculator.calculate_ma(doc)
-                else:
-                    assert False
-                if not result:
-                    continue
-                pnl = result['pnl']
-                print('#{}'.format(i))
-                print('# pnl={:,.3f}  delta={:,.3f}'.format(pnl, result['pnl']))
-                pprint(result)
-                json_data.append(copy.deepcopy(result))
-            except Exception:
-                logging.error(pformat(doc))
-                raise
-        balances = copy.deepcopy(calculator.balances)
-        for currency, debt in calculator.debt_balances.items():
-            balances[currency]['qty'] += debt['qty']
-        print('#balances')
-        pprint(balances)
-        json_data = {
-            'result': balances,
-            'pnl': json_data[-1]['pnl'],
-            'history': json_data,
-        }
-        with open(json_file, 'w') as f:
-            json.dump(json_data, f, sort_keys=True, indent=4, default=support_datetime_default)
-        with open('ma_result.json', 'w') as f:
-            json.dump(balances, f, sort_keys=True, indent=4, default=support_datetime_default)
-        return
-    if args['ma2']:
-        calculator = Calculator()
-        calculator.reset()
-        if args['--balance']:
-            with open(args['--balance']) as f:
-                balances = json.load(f)
-                calculator.load_balances(balances)
-        daily_pnl = .0
-        hourly_pnl = .0
-        pnl = .0
-        daily_stop = None
-        hourly_stop = None
-        json_data = []
-        for i, doc in enumerate(collection.find({'time': {'$gt': start_after, '$lt': stop}}).sort('time', 1), 1):
-            try:
-                doc['time'] = t = UTC.localize(doc['time'])
-                if daily_stop is None:
-                    daily_stop = t.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-                if hourly_stop is None:
-                    hourly_stop = t.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-                while hourly_stop <= t:
-                    print('# {} hourly_pnl={:,.3f} delta={:,.3f}'.format(
-                        hourly_stop, pnl, pnl - hourly_pnl))
-                    pprint(calculator.get_current_value(hourly_stop - timedelta(hours=1)))
-                    hourly_pnl = pnl
-                    hourly_stop += timedelta(hours=1)
-                while daily_stop <= t:
-                    print('# {} daily_pnl={:,.3f} delta={:,.3f}'.format(
-                        daily_stop, pnl, pnl - daily_pnl))
-                    pprint(calculator.get_current_value(daily_stop - timedelta(days=1)))
-                    daily_pnl = pnl
-                    daily_stop += timedelta(days=1)
-                result = calculator.calculate_ma2(doc)
-                if not result:
-                    continue
-                pnl = result['pnl']
-                print('#{}'.format(i))
-                print('# pnl={:,.3f}  delta={:,.3f}'.format(pnl, result['pnl']))
-                pprint(result)
-                json_data.append(copy.deepcopy(result))
-            except Exception:
-                logging.error(pformat(doc))
-                raise
-        balances = copy.deepcopy(calculator.balances)
-        for currency, debt in calculator.debt_balances.items():
-            balances[currency]['qty'] += debt['qty']
-        print('#balances')
-        pprint(balances)
-        json_data = {
-            'result': balances,
-            'pnl': json_data[-1]['pnl'],
-            'history': json_data,
-        }
-        with open(json_file, 'w') as f:
-            json.dump(json_data, f, sort_keys=True, indent=4, default=support_datetime_default)
-        with open('ma2_result.json', 'w') as f:
+        snapshots = journal = None
+        if args['--snapshot-dir']:
+            snapshots = SnapshotStore(args['--snapshot-dir'], method)
+            journal = Journal(args['--snapshot-dir'], method)
+            journal.load()
+        snapshot_every = int(args['--snapshot-every'])
+        after = start_after
+        restore_key = resume_key = None
+        if args['--resume']:
+            assert snapshots, '--resume needs --snapshot-dir'
+            restore_key = (start,)
+        if args['--incremental']:
+            assert snapshots, '--incremental needs --snapshot-dir'
+            if journal.entries:
+                docs = (dict(x, time=UTC.localize(x['time']))
+                        for x in find_docs(calculator, collection, exchanges, args['--direct'],
+                                           after, stop, PROJECTION))
+                restore_key = journal.first_change(docs)
+                if not restore_key:
+                    print('#no change pnl={:,.3f}'.format(journal.pnl))
+                    return
+                print('#changed {}'.format(restore_key))
+        previous_pnl = journal and journal.pnl
+        if restore_key:
+            resume_key = snapshots.restore(calculator, restore_key, prune=not max_docs)
+            print('#resume {}'.format(resume_key))
+            if resume_key:
+                after = resume_key[0] - timedelta(microseconds=1)
+        if journal:
+            journal.truncate(resume_key)
+        keys = previous_json = previous_columnar = None
+        if args['--incremental'] and resume_key:
+            # the documents up to resume_key are unchanged, copy their rows of the previous run
+            keys = {output_key(dict(zip(SORT_KEYS, key))) for key, _ in journal.entries}
+            previous_json = move_aside(json_file)
+            previous_columnar = args['--columnar'] and move_aside(args['--columnar'])
+        pnl = calculator.pnl
+        # the report values the balances, not needed when it is not output
+        report = PnlReport(calculator, [] if row_logger.quiet else [x for x in args['--report'].split(',') if x])
+        with open(json_file, 'w') as f, contextlib.ExitStack() as stack:
+            writer = json_writer(f, args['--format'], compact=args['--compact'],
+                                 default=support_datetime_default)
+            columnar = None
+            if args['--columnar']:
+                ma_old_pnl = calculator.balances['pnl'].jpy if 'pnl' in calculator.balances else .0
+                columnar = stack.enter_context(ColumnarWriter(args['--columnar'], pnl=ma_old_pnl))
+            if previous_json:
+                with open(previous_json) as previous:
+                    for row in prefix_rows(read_json_rows(previous, args['--format']), keys):
+                        writer.write(row)
+            if previous_columnar:
+                for row in prefix_rows(read_columnar_rows(previous_columnar), keys):
+                    columnar.write_row(row)
+            docs = itertools.islice(find_docs(calculator, collection, exchanges, args['--direct'], after, stop),
+                                    max_docs)
+            for i, doc in enumerate(docs, 1):
+                try:
+                    doc['time'] = t = UTC.localize(doc['time'])
+                    key = doc_key(doc)
+                    if resume_key and key <= resume_key:
+                        continue
+                    if journal:
+                        journal.append(doc)
+                    report.output(report.feed(t, pnl), row_logger.message)
+                    result = calculate(doc)
+                    if snapshots and not max_docs and i % snapshot_every == 0:
+                        snapshots.save(calculator, key)
+                    if not result:
+                        continue
+                    pnl = result['pnl']
+                    row_logger.row(i, '# pnl={:,.3f}  delta={:,.3f}'.format(pnl, result['pnl']), result,
+                                   negative=lambda: has_debt(result))
+                    writer.write(result)
+                    if columnar:
+                        columnar.write(result)
+                except Exception:
+                    logging.error(pformat(doc))
+                    raise
+            balances = copy.deepcopy(calculator.balances)
+            for currency, debt in calculator.debt_balances.items():
+                balances[currency]['qty'] += debt['qty']
+            print('#balances')
+            pprint(balances)
+            writer.finish(pnl=pnl, result=balances)
+        for path in (previous_json, previous_columnar):
+            if path:
+                os.remove(path)
+        if max_docs:
+            # the state of a slice of the data
+            return
+        if journal:
+            journal.pnl = calculator.balances['pnl']['jpy'] if method == 'ma_old' else calculator.pnl
+            journal.save()
+            if args['--incremental'] and previous_pnl is not None:
+                print('#pnl {:,.3f} -> {:,.3f} diff={:,.3f}'.format(
+                    previous_pnl, journal.pnl, journal.pnl - previous_pnl))
+        with open('{}_result.json'.format('ma2' if method == 'ma2' else 'ma'), 'w') as f:
             json.dump(balances, f, sort_keys=True, indent=4, default=support_datetime_default)
         return
     if args['ga']:
-        calculator = Calculator()
+        calculator = new_calculator()
         calculator.reset()
         if args['--balance']:
             with open(args['--balance']) as f:
                 balances = json.load(f)
                 calculator.load_balances(balances)
-        for i, doc in enumerate(collection.find({'time': {'$gt': start_after, '$lt': stop}}).sort('time', 1), 1):
+        engine = TotalAverageEngine(calculator)
+        docs = itertools.islice(find_docs(calculator, collection, exchanges, args['--direct'], start_after, stop),
+                                max_docs)
+        for i, doc in enumerate(docs, 1):
             try:
                 doc['time'] = t = UTC.localize(doc['time'])
-                result = calculator.calculate_ga_prepare(doc)
-                print('#{}'.format(i))
-                pprint(result)
+                result = engine.feed(doc)
+                row_logger.row(i, '', result)
             except Exception:
                 logging.error(pformat(doc))
                 raise
-        json_data = []
-        calculator.pnl = .0
-        for i, doc in enumerate(collection.find({'time': {'$gt': start_after, '$lt': stop}}).sort('time', 1), 1):
-            try:
-                doc['time'] = t = UTC.localize(doc['time'])
-                result = calculator.calculate_ga(doc)
-                print('#{}'.format(i))
-                if not result:
-                    continue
+        with open(json_file, 'w') as f, contextlib.ExitStack() as stack:
+            writer = json_writer(f, args['--format'], None, compact=args['--compact'],
+                                 default=support_datetime_default)
+            columnar = stack.enter_context(ColumnarWriter(args['--columnar'])) if args['--columnar'] else None
+            for i, result in enumerate(engine.results(), 1):
                 pnl = result['pnl']
-                print('#{}'.format(i))
-                print('# pnl={:,.3f}  delta={:,.3f}'.format(pnl, result['pnl']))
-                json_data.append(result)
-            except Exception:
-                logging.error(pformat(doc))
-                raise
+                row_logger.row(i, '# pnl={:,.3f}  delta={:,.3f}'.format(pnl, result['pnl_delta']))
+                writer.write(result)
+                if columnar:
+                    columnar.write(result)
+            writer.finish()
         print('#ga_cost')
         pprint(calculator.ga_costs)
-        balances = copy.deepcopy(calculator.ga_costs)
-        for v in balances.values():
-            v['qty'] = v['remain']
-            del v['remain']
-            v['jpy'] = v['qty'] * v['price']
-        with open(json_file, 'w') as f:
-            json.dump(json_data, f, sort_keys=True, indent=4, default=support_datetime_default)
+        balances = {}
+        for k, v in calculator.ga_costs.items():
+            balances[k] = dict(qty=v.remain, jpy=v.remain * v.price, price=v.price)
+        if max_docs:
+            return
         with open('ga_result.json', 'w') as f:
             json.dump(balances, f, sort_keys=True, indent=4, default=support_datetime_default)
         return
@@ -1,10 +1,27 @@
-from . import bitbankcc
-from . import bitfinex
-from . import bitflyer
-from . import bitmex
-from . import coincheck
-from . import kraken
-from . import minbtc
-from . import quoinex
-from . import zaif
-from . import xmr
+import importlib
+
+EXCHANGES = (
+    'bitbankcc',
+    'bitfinex',
+    'bitflyer',
+    'bitmex',
+    'coincheck',
+    'kraken',
+    'minbtc',
+    'quoinex',
+    'zaif',
+    'xmr',
+)
+
+
+def __getattr__(name: str):
+    # exchange modules pull in ccxt, pandas, python_bitbankcc etc. so import them on first use
+    if name in EXCHANGES:
+        module = importlib.import_module('.{}'.format(name), __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(EXCHANGES))
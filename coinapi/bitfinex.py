@@ -1,7 +1,7 @@
 import os
 import re
 import time
-from collections import OrderedDict, defaultdict
+from collections import defaultdict
 from datetime import datetime
 from typing import Generator
 
@@ -9,15 +9,16 @@ import ccxt
 from ccxt import DDoSProtection, ExchangeNotAvailable
 
 from .ccxtclient import CCXTClient
+from .pagededup import PageDedup
 from .ratelimiter import RateLimiter
 
 
 class Client(CCXTClient):
     NAME = 'bitfinex'
     LIMIT = 500
-    CACHE_LIMIT = 10000
     CCXT_CLASS = ccxt.bitfinex
     COLLECTIONS = ('balance_history',)
+    HISTORY_KEYS = ('timestamp', 'currency', 'amount', 'balance', 'description')
 
     def balance(self):
         balances = defaultdict(lambda: dict(total=.0, used=.0, free=.0))
@@ -43,23 +44,20 @@ class Client(CCXTClient):
         fn = RateLimiter(rps_limit, fn)
         limit = self.LIMIT
         timestamp = None
-        cache = OrderedDict()
+        dedup = PageDedup()
         while True:
             if timestamp:
                 params.update(until=timestamp)
             res = fn(params)
             processed_n = 0
+            dedup.next_page()
             for x in res:
                 ts = x['timestamp']
                 x = parse(x)
-                _id = x['id']
-                if _id not in cache:
-                    cache[_id] = True
-                    if len(cache) > self.CACHE_LIMIT:
-                        cache.popitem(last=False)
+                if dedup.add(x['id']):
                     yield x
+                    processed_n += 1
                 timestamp = ts
-                processed_n += 1
             if len(res) < limit:
                 break
             if processed_n == 0:
@@ -82,7 +80,7 @@ class Client(CCXTClient):
         # rate limit: 20 req/min
         def parse(data: dict):
             ts = data['timestamp']
-            digest = self.json_hash(data)
+            digest = self.record_id(data, self.HISTORY_KEYS)
             return dict(time=self.utc_from_timestamp(float(ts)),
                         id='{}_{}'.format(currency, digest),
                         data=data)
@@ -108,7 +106,7 @@ class Client(CCXTClient):
         # rate limit: 20 req/min
         def parse(data: dict):
             ts = data['timestamp']
-            digest = self.json_hash(data)
+            digest = self.record_id(data, ('id',))
             return dict(time=self.utc_from_timestamp(float(ts)),
                         id='{}_{}'.format(currency, digest),
                         data=data)
@@ -134,7 +132,7 @@ class Client(CCXTClient):
         # rate limit: 45 req/min
         def parse(data: dict):
             ts = data['timestamp']
-            digest = self.json_hash(data)
+            digest = self.record_id(data, ('tid',))
             return dict(time=self.utc_from_timestamp(float(ts)),
                         id='{}_{}'.format(instrument, digest),
                         data=data)
@@ -418,7 +416,7 @@ class Client(CCXTClient):
         fn = RateLimiter(rps_limit, getattr(api, 'publicGetTradesSymbolHist'))
         limit = self.LIMIT
         params = dict(symbol='t{}'.format(self.instruments[instrument]['id']), limit=limit, sort=1)
-        cache = OrderedDict()
+        dedup = PageDedup()
         start = int(start.timestamp() * 1000)
         stop = int(stop.timestamp() * 1000)
         mts = start
@@ -427,14 +425,13 @@ class Client(CCXTClient):
                 params.update(start=mts)
                 res = fn(params)
                 processed_n = 0
+                dedup.next_page()
                 for data in res:
                     _id, mts, amount, price = data
                     if start <= mts < stop:
                         processed_n += 1
-                        if _id not in cache:
-                            cache[_id] = True
-                            if len(cache) > self.CACHE_LIMIT:
-                                cache.popitem(last=False)
+                        if not dedup.add(_id):
+                            continue
                         yield dict(time=self.utc_from_timestamp(mts / 1000),
                                    id=_id,
                                    price=price,
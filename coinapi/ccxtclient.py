@@ -6,6 +6,7 @@ from typing import Type
 
 from ccxt import Exchange, DDoSProtection, ExchangeNotAvailable
 
+from coinmetrics import metrics
 from .clientbase import ClientBase
 
 
@@ -42,20 +43,28 @@ class CCXTClient(ClientBase):
 
     def __getattr__(self, item):
         fn = getattr(self._delegate, item)
+        name = '{}.{}'.format(self.NAME, item)
 
         def retry(*args, **kwargs):
             start = time.time()
             while time.time() - start < self.RATE_LIMIT_TIMEOUT:
                 try:
-                    return fn(*args, **kwargs)
+                    with metrics.timer(name):
+                        return fn(*args, **kwargs)
                 except DDoSProtection:
+                    metrics.count('ccxt.retry.ddos_protection')
                     self.info('DDoSProtection. sleep {} seconds.'.format(self.RATE_LIMIT_INTERVAL))
                 except ExchangeNotAvailable as e:
+                    metrics.count('ccxt.retry.not_available')
                     self.warning(str(e))
                 except Exception as e:
-                    time.sleep(self._handle_error(e) or 0)
+                    metrics.count('ccxt.retry.error')
+                    with metrics.timer('ccxt.retry_sleep'):
+                        time.sleep(self._handle_error(e) or 0)
                     continue
-                time.sleep(self.RATE_LIMIT_INTERVAL)
+                with metrics.timer('ccxt.retry_sleep'):
+                    time.sleep(self.RATE_LIMIT_INTERVAL)
+            metrics.count('ccxt.retry.timeout')
             raise Exception('retry timeout')
 
         return retry
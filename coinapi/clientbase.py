@@ -1,5 +1,7 @@
 import base64
+import functools
 import hashlib
+import itertools
 import json
 import logging
 import pathlib
@@ -16,6 +18,55 @@ import yaml
 
 from coindb import Database, DBCollection
 from coindb.bulkop import BulkOp
+from .metadatacache import MetadataCache
+
+# fixed formats emitted by exchange APIs and CSV reports; anything else goes to dateutil
+TIME_FORMATS = (
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d %H:%M:%S.%f',
+    '%Y/%m/%d',
+    '%Y-%m-%d %H:%M:%S %z',
+)
+TIME_PARSER_CACHE_LIMIT = 256
+_DIGITS = str.maketrans('0123456789', '0000000000')
+_time_parsers = {}
+
+
+def _parse_iso_time(s: str) -> datetime:
+    if s.endswith('Z'):
+        s = s[:-1] + '+00:00'
+    return datetime.fromisoformat(s)
+
+
+def _strptime(time_format: str, s: str) -> datetime:
+    return datetime.strptime(s, time_format)
+
+
+def _find_time_parser(s: str):
+    for parser in [_parse_iso_time] + [functools.partial(_strptime, f) for f in TIME_FORMATS]:
+        try:
+            parser(s)
+            return parser
+        except ValueError:
+            continue
+    return dateutil.parser.parse
+
+
+def _parse_time_str(s: str) -> datetime:
+    # strings with the same digit layout share a parser, e.g. 2018/01/02 03:04:05 -> 0000/00/00 00:00:00
+    shape = s.translate(_DIGITS)
+    parser = _time_parsers.get(shape)
+    if parser is None:
+        parser = _find_time_parser(s)
+        if len(_time_parsers) < TIME_PARSER_CACHE_LIMIT:
+            _time_parsers[shape] = parser
+    if parser is dateutil.parser.parse:
+        return parser(s)
+    try:
+        return parser(s)
+    except ValueError:
+        return dateutil.parser.parse(s)
 
 
 class ClientBase(ABC):
@@ -30,6 +81,8 @@ class ClientBase(ABC):
     JST = pytz.timezone('Asia/Tokyo')
     NYT = pytz.timezone('America/New_York')
     COLLECTIONS = ()
+    LEGACY_RECORD_ID = False
+    METADATA_TTL = MetadataCache.TTL
 
     def __init__(self, api_key: str = None, api_secret: str = None, timeout: float = None, **__):
         assert self.NAME
@@ -53,6 +106,7 @@ class ClientBase(ABC):
         self._rcurrencies = {}  # type:Dict[str, dict]
         self._instruments = {}  # type: Dict[str, dict]
         self._rinstruments = {}  # type: Dict[str, dict]
+        self.metadata_cache = MetadataCache(self.NAME, self.METADATA_TTL)
 
     def debug(self, *args, **kwargs):
         return self.logger.debug(*args, **kwargs)
@@ -89,7 +143,7 @@ class ClientBase(ABC):
     @property
     def currencies(self):
         if not self._currencies:
-            self._currencies = self.get_currencies()
+            self._currencies = self.metadata_cache.get('currencies', self.get_currencies)
         return self._currencies
 
     @currencies.setter
@@ -114,7 +168,7 @@ class ClientBase(ABC):
     @property
     def instruments(self):
         if not self._instruments:
-            self._instruments = self.get_instruments()
+            self._instruments = self.metadata_cache.get('instruments', self.get_instruments)
         return self._instruments
 
     @instruments.setter
@@ -132,6 +186,17 @@ class ClientBase(ABC):
     def rinstruments(self, value):
         self._rinstruments = value
 
+    def set_metadata_offline(self):
+        # use cached instruments/currencies regardless of age
+        self.metadata_cache.ttl = None
+
+    def refresh_metadata(self):
+        self.metadata_cache.refresh = True
+        self._currencies = {}
+        self._rcurrencies = {}
+        self._instruments = {}
+        self._rinstruments = {}
+
     @abstractmethod
     def tick(self, instrument:str):
         pass
@@ -167,7 +232,7 @@ class ClientBase(ABC):
     def parse_time(cls, time_obj: Union[str, datetime], tz: pytz.timezone = None) -> datetime:
         assert isinstance(time_obj, (str, datetime)), (type(time_obj), time_obj)
         if isinstance(time_obj, str):
-            time_obj = dateutil.parser.parse(time_obj)
+            time_obj = _parse_time_str(time_obj)
         if not time_obj.tzinfo:
             assert tz, '{} is naive. tz must set'.format(time_obj)
             time_obj = tz.localize(time_obj)
@@ -179,6 +244,23 @@ class ClientBase(ABC):
     def json_hash(cls, data: dict) -> str:
         return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
 
+    @classmethod
+    def record_id(cls, data: dict, keys: Sequence[str] = None) -> str:
+        """
+        stable id of a raw record without a natural key.
+        keys: identifying fields in a fixed order, all of them must be present. all fields are used if omitted.
+        LEGACY_RECORD_ID = True gives json_hash() ids of databases imported before.
+        """
+        if cls.LEGACY_RECORD_ID:
+            return cls.json_hash(data)
+        if keys is None:
+            values = ['{}\x1e{}'.format(k, data[k]) for k in sorted(data)]
+        else:
+            missing = [k for k in keys if k not in data]
+            assert not missing, (missing, data)
+            values = [str(data[k]) for k in keys]
+        return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=16).hexdigest()
+
     def bulk_op(self, collection: DBCollection):
         return BulkOp(collection, self.logger)
 
@@ -187,7 +269,8 @@ class ClientBase(ABC):
     def import_data_methods(self) -> Dict[str, Sequence[Sequence]]:
         pass
 
-    def import_data_all(self, db: Database, start: str, stop: str, *, drop: bool = False):
+    def import_data_all(self, db: Database, start: str, stop: str, *, drop: bool = False, max_docs: int = None):
+        """max_docs: documents read from each import method at most, to profile a slice of them"""
         _, _ = start, stop
         for name, methods in self.import_data_methods.items():
             assert name in self.COLLECTIONS, '{} not in {}'.format(name, self.COLLECTIONS)
@@ -200,7 +283,7 @@ class ClientBase(ABC):
                 self.info('{}{}'.format(method.__name__, tuple(args)))
                 with self.bulk_op(collection) as bulk_op:
                     try:
-                        for data in method(*args):
+                        for data in itertools.islice(method(*args), max_docs):
                             bulk_op.insert(data)
                     except Exception as e:
                         self.exception(str(e))
@@ -209,10 +292,15 @@ class ClientBase(ABC):
     def convert_data(self, name: str) -> Generator[dict, dict, None]:
         pass
 
-    def convert_data_all(self, db: Database, start: str, stop: str, *, drop: bool = False):
+    def convert_data_all(self, db: Database, start: str, stop: str, *, drop: bool = False, max_docs: int = None,
+                         out_name: str = 'converted'):
+        """
+        max_docs: documents converted from each collection at most, to profile a slice of them
+        out_name: collection of the converted documents
+        """
         _, _ = start, stop
         assert self.COLLECTIONS
-        out_collection = db['converted']
+        out_collection = db[out_name]
         if drop:
             out_collection.drop()
         out_collection.create_index([('time', 1), ('kind', 1), ('id', 1)], unique=True)
@@ -225,7 +313,7 @@ class ClientBase(ABC):
                     converter = self.convert_data(name)
                     _ = next(converter)
                     assert not _, _
-                    for data in collection.find({}, {'_id': 0}).sort([('time', 1), ('id', 1)]):
+                    for data in collection.find({}, {'_id': 0}).sort([('time', 1), ('id', 1)]).limit(max_docs or 0):
                         assert '_id' not in data
                         try:
                             one_or_list = converter.send(data)
@@ -1,9 +1,10 @@
-from collections import OrderedDict, defaultdict
+from collections import defaultdict
 from typing import Generator
 
 import ccxt
 
 from .ccxtclient import CCXTClient
+from .pagededup import PageDedup
 from .ratelimiter import RateLimiter
 
 
@@ -11,14 +12,13 @@ class Client(CCXTClient):
     NAME = 'kraken'
     CCXT_CLASS = ccxt.kraken
     LIMIT = 500
-    CACHE_LIMIT = 10000
     COLLECTIONS = ('execution', 'deposit', 'withdrawal')
 
     def get_page_items(self, fn, parse, page_key: str, rps_limit: float, **params):
         fn = RateLimiter(rps_limit, fn)
         timestamp = int(self.utc_now().timestamp())
         offset = 0
-        cache = OrderedDict()
+        dedup = PageDedup()
         while True:
             params.update(end=timestamp, ofs=offset)
             res = fn(params)
@@ -26,12 +26,10 @@ class Client(CCXTClient):
             items = result[page_key]
             if len(items) <= 0:
                 break
+            dedup.next_page()
             for x in sorted(map(lambda kv: parse(*kv), items.items()),
                             key=lambda _: _['time'], reverse=True):
-                if x['id'] not in cache:
-                    cache[x['id']] = True
-                    if len(cache) > self.CACHE_LIMIT:
-                        cache.popitem(last=False)
+                if dedup.add(x['id']):
                     yield x
             offset += len(items)
 
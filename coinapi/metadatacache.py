@@ -0,0 +1,56 @@
+import json
+import os
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+
+class MetadataCache:
+    DIRECTORY = pathlib.Path.home() / '.cache' / 'coinapi'
+    TTL = 24 * 60 * 60.0
+
+    def __init__(self, name: str, ttl: Optional[float] = TTL, directory: pathlib.Path = None):
+        """
+        ttl: seconds a cached file stays fresh. None means never expire (offline use).
+        """
+        self.name = name
+        self.ttl = ttl
+        self.directory = pathlib.Path(directory or self.DIRECTORY)
+        self.refresh = False
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.directory / '{}_{}.json'.format(self.name, key)
+
+    def is_fresh(self, path: pathlib.Path) -> bool:
+        if not path.exists():
+            return False
+        if self.ttl is None:
+            return True
+        return time.time() - path.stat().st_mtime < self.ttl
+
+    def load(self, key: str) -> Optional[Dict[str, dict]]:
+        path = self.path(key)
+        if self.refresh or not self.is_fresh(path):
+            return None
+        with path.open('r') as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+
+    def save(self, key: str, value: Dict[str, dict]):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with tmp_path.open('w') as f:
+            json.dump(value, f)
+        os.replace(str(tmp_path), str(path))
+
+    def get(self, key: str, loader: Callable[[], Dict[str, dict]]) -> Dict[str, dict]:
+        value = self.load(key)
+        if value is None:
+            value = loader()
+            self.save(key, value)
+        return value
+
+    def clear(self):
+        for path in self.directory.glob('{}_*.json'.format(self.name)):
+            path.unlink()
@@ -26,7 +26,7 @@ class Client(ClientBase):
     def load_reports_all_json(self, json_data: Sequence[dict]):
         for data in json_data:
             yield dict(time=self.parse_time(data['time'], self.UTC),
-                       id=self.json_hash(data),
+                       id=self.record_id(data),
                        data=data)
 
     def load_reports_all_json_file(self, path: str):
@@ -0,0 +1,29 @@
+from typing import Hashable
+
+
+class PageDedup:
+    """
+    suppress items repeated across consecutive pages.
+    overlaps only happen at page boundaries (inclusive cursors, offsets shifted by new items),
+    so ids of the current and previous page are enough to remember.
+    """
+
+    def __init__(self):
+        self._previous = set()
+        self._current = set()
+
+    def next_page(self):
+        self._previous, self._current = self._current, set()
+
+    def add(self, _id: Hashable) -> bool:
+        """return True if _id is new"""
+        if _id in self._current or _id in self._previous:
+            return False
+        self._current.add(_id)
+        return True
+
+    def __contains__(self, _id: Hashable) -> bool:
+        return _id in self._current or _id in self._previous
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
@@ -8,6 +8,7 @@ import ccxt
 import os
 
 from .ccxtclient import CCXTClient
+from .pagededup import PageDedup
 from .ratelimiter import RateLimiter
 
 
@@ -28,7 +29,6 @@ class Client(CCXTClient):
     NAME = 'quoinex'
     CCXT_CLASS = _Quoinex
     LIMIT = 500
-    CACHE_LIMIT = 10000
     FIAT_CURRENCIES = {'AUD', 'CNY', 'EUR', 'HKD', 'IDR', 'INR', 'JPY', 'PHP', 'SGD', 'USD'}
     CRYPTO_CURRENCIES = {'BCH', 'BTC', 'ETH', 'QASH', 'XRP'}
     SUPPORTED_CURRENCIES = FIAT_CURRENCIES | CRYPTO_CURRENCIES
@@ -59,17 +59,15 @@ class Client(CCXTClient):
         limit = self.LIMIT
         params = params.copy()
         page = 1
-        cache = OrderedDict()
+        dedup = PageDedup()
         fn = RateLimiter(rps_limit, fn)
         while True:
             params.update(page=page, limit=limit)
             res = fn(params)
+            dedup.next_page()
             for model in res['models']:
                 item = parse(model)
-                if item['id'] not in cache:
-                    cache[item['id']] = True
-                    if len(cache) > self.CACHE_LIMIT:
-                        cache.popitem(last=False)
+                if dedup.add(item['id']):
                     yield item
                 else:
                     self.warning('#duplicate entry {}'.format(pformat(model)))
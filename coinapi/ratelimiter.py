@@ -1,5 +1,7 @@
 import time
 
+from coinmetrics import metrics
+
 
 class RateLimiter:
     def __init__(self, request_per_seconds_limit: float, fn):
@@ -11,8 +13,10 @@ class RateLimiter:
         now = time.time()
         elapsed = now - self._last_called_at
         wait_seconds = self._min_interval - elapsed
+        metrics.count('rate_limiter.wait')
         if wait_seconds > 0:
-            time.sleep(wait_seconds)
+            with metrics.timer('rate_limiter.sleep'):
+                time.sleep(wait_seconds)
 
     def __call__(self, *args, **kwargs):
         self.wait()
@@ -11,6 +11,7 @@ from dateutil.relativedelta import relativedelta
 from requests import HTTPError
 
 from .ccxtclient import CCXTClient
+from .pagededup import PageDedup
 from .ratelimiter import RateLimiter
 
 
@@ -18,7 +19,6 @@ class Client(CCXTClient):
     NAME = 'zaif'
     CCXT_CLASS = ccxt.zaif
     LIMIT = 500
-    CACHE_LIMIT = 10000
     FIAT_CURRENCIES = {'JPY', }
     COLLECTIONS = ('tip_send_report', 'tip_receive_report', 'bonus_report',
                    'execution', 'position',
@@ -74,20 +74,17 @@ class Client(CCXTClient):
         params = params.copy()
         params.update(limit=limit)
         fn = RateLimiter(rps_limit, fn)
-        cache = OrderedDict()
+        dedup = PageDedup()
         while True:
             params['from'] = from_i
             res = fn(params)['return']
             if not len(res):
                 break
+            dedup.next_page()
             for k, v in sorted(res.items(), key=lambda _x: int(_x[0]), reverse=True):
                 k = int(k)
-                if k not in cache:
-                    cache[k] = True
-                    x = parse(k, v)
-                    if len(cache) > self.CACHE_LIMIT:
-                        cache.popitem(last=False)
-                    yield x
+                if dedup.add(k):
+                    yield parse(k, v)
             from_i += len(res)
 
     def executions(self, instrument: str) -> Generator[dict, None, None]:
@@ -1,3 +1,4 @@
+import heapq
 from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Sequence, Optional
@@ -6,6 +7,13 @@ import pymongo
 from dateutil.relativedelta import relativedelta
 
 from coinapi.clientbase import ClientBase
+from coinmetrics import metrics
+from .fxcalendar import FXCalendar
+from .position import Positions, CostPosition
+from .rategraph import RateGraph
+from .ratetable import RATE_TIME, RateTable
+from .snapshot import doc_key
+from .moving_average import MAPolicy, MovingAverageEngine, MA_OLD, MA, MA2, SIMPLE
 
 UTC = ClientBase.UTC
 JST = ClientBase.JST
@@ -47,14 +55,20 @@ class Calculator:
         'QSH': 'QASH',
     }
 
-    def __init__(self):
+    def __init__(self, rate_graph: RateGraph = None, rate_table: RateTable = None):
         self._collection_cache = {}
+        self._fx_calendars = {}
         self.rate_cache = {}
+        # rates through the cheapest path of the candle collections instead of the routes above
+        self.rate_graph = rate_graph
+        # daily rates read before the candles
+        self.rate_table = rate_table
         self.pnl = .0
-        self.balances = defaultdict(lambda: dict(qty=.0, jpy=.0, price=float('nan')))
-        self.debt_balances = defaultdict(lambda: dict(qty=.0, jpy=.0, price=float('nan')))
-        self.ga_costs = defaultdict(lambda: dict(qty=.0, jpy=.0, price=float('nan')))
+        self.balances = Positions()
+        self.debt_balances = Positions()
+        self.ga_costs = Positions(CostPosition)
         self.ga_outcomes = defaultdict(float)
+        self._ma_engines = {}
 
     def reset(self):
         self.pnl = .0
@@ -67,8 +81,22 @@ class Calculator:
             self.balances[k].update(**v)
             self.ga_costs[k].update(**v)
 
+    def state(self) -> dict:
+        return dict(balances=self.balances,
+                    debt_balances=self.debt_balances,
+                    ga_costs=self.ga_costs,
+                    ga_outcomes=self.ga_outcomes,
+                    pnl=self.pnl)
+
+    def load_state(self, state: dict):
+        self.balances = state['balances']
+        self.debt_balances = state['debt_balances']
+        self.ga_costs = state['ga_costs']
+        self.ga_outcomes = state['ga_outcomes']
+        self.pnl = state['pnl']
+
     def reset_debt_balances(self):
-        self.debt_balances = defaultdict(lambda: dict(qty=.0, jpy=.0, price=float('nan')))
+        self.debt_balances = Positions()
 
     def get_current_value(self, dt: datetime):
         value = .0
@@ -91,15 +119,17 @@ class Calculator:
             self._collection_cache[key] = pymongo.MongoClient()[db][collection]
         return self._collection_cache[key]
 
+    def fx_calendar(self, db: str, collection: str) -> FXCalendar:
+        key = (db, collection)
+        if key not in self._fx_calendars:
+            self._fx_calendars[key] = FXCalendar.load(self.get_collection(db, collection))
+        return self._fx_calendars[key]
+
     def get_fiat_rate(self, currency: str, dt: datetime):
         if currency in ('JPY',):
             return 1.0
         d = self.FIAT_CURRENCIES[currency]
-        db = d['db']
-        collection = self.get_collection(db, '{}/JPY'.format(currency))
-        for doc in collection.find({'time': {'$lt': dt - timedelta(days=1)}}).sort('time', -1):
-            return doc['c']
-        assert False
+        return self.fx_calendar(d['db'], '{}/JPY'.format(currency)).close_before(dt - timedelta(days=1))
 
     def get_crypto_rate(self, currency: str, dt: datetime):
         d = self.CRYPTO_CURRENCIES[currency]
@@ -113,221 +143,125 @@ class Calculator:
         assert False
 
     def get_rate(self, currency: str, dt: datetime):
+        """
+        one rate per currency and JST day, read at RATE_TIME of the day like build_rate_table.py
+        so that it does not depend on which document of the day asks first.
+        """
         assert dt.tzinfo
         dt_base = dt.astimezone(JST).replace(hour=0, minute=0, second=0, microsecond=0)
         key = (currency, dt_base)
-        if dt_base not in self.rate_cache:
-            if currency in self.FIAT_CURRENCIES:
-                rate = self.get_fiat_rate(currency, dt)
-            else:
-                assert currency in self.CRYPTO_CURRENCIES, (currency, self.CRYPTO_CURRENCIES)
-                rate = self.get_crypto_rate(currency, dt)
+        metrics.count('get_rate')
+        if key not in self.rate_cache:
+            with metrics.timer('get_rate.miss'):
+                rate_dt = dt_base + RATE_TIME
+                rate = self.rate_table.get(currency, rate_dt) if self.rate_table else None
+                if rate is None:
+                    if self.rate_graph:
+                        rate = self.rate_graph.rate(currency, rate_dt)
+                    elif currency in self.FIAT_CURRENCIES:
+                        rate = self.get_fiat_rate(currency, rate_dt)
+                    else:
+                        assert currency in self.CRYPTO_CURRENCIES, (currency, self.CRYPTO_CURRENCIES)
+                        rate = self.get_crypto_rate(currency, rate_dt)
             self.rate_cache[key] = rate
         return self.rate_cache[key]
 
     def import_data(self, exchanges: Sequence[str], start: datetime, stop: datetime):
-        start_after = start
-        stop = stop
         db_client = pymongo.MongoClient()
         for exchange in sorted(exchanges):
-            collection = db_client[exchange]['converted']
-            for doc in collection.find({'time': {'$gt': start_after, '$lt': stop}},
-                                       {'_id': 0}).sort('time', 1):
-                assert '_id' not in doc
-                if doc.get('skip'):
-                    continue
-                kind = doc['kind']
-                assert len(doc['pnl']) > 0
-                if isinstance(doc['pnl'][0], str):
-                    pnl_list = [doc['pnl']]
-                else:
-                    pnl_list = doc['pnl']
-                currencies = list(set([self.CURRENCY_MAP.get(_[0], _[0]) for _ in pnl_list]))
-                for _ in currencies:
-                    assert _ in self.SUPPORTED_CURRENCIES, (_, self.SUPPORTED_CURRENCIES)
-                incomes = defaultdict(float)
-                outcomes = defaultdict(float)
-                fees = defaultdict(float)
-                for currency, qty, note in pnl_list:
-                    if not qty:
-                        continue
-                    currency = self.CURRENCY_MAP.get(currency, currency)
-                    if 'fee' in note:
-                        assert qty < 0
-                        fees[currency] += qty
-                    elif qty > 0:
-                        assert 'fee' not in note
-                        incomes[currency] += qty
-                    elif qty < 0:
-                        assert 'fee' not in note
-                        outcomes[currency] += qty
-                    else:
-                        assert False, doc
-                if kind in ('deposit', 'withdrawal'):
-                    if list(currencies) == ['JPY']:
-                        kind = 'jpy_{}'.format(kind)
-                incomes = list(sorted(incomes.items()))
-                outcomes = list(sorted(outcomes.items()))
-                fees = list(sorted(fees.items()))
-                doc.update(kind=kind, exchange=exchange,
-                           incomes=incomes, outcomes=outcomes, fees=fees)
-                del doc['pnl']
-                yield doc
-
-    def calculate_ma_old(self, doc: dict):
-        doc_time = doc['time']
-        kind = doc['kind']
-        instrument = ''
-        side = ''
-        incomes = defaultdict(lambda: dict(qty=.0, jpy=.0))
-        outcomes = defaultdict(lambda: dict(qty=.0, jpy=.0))
-        fees = defaultdict(lambda: dict(qty=.0, jpy=.0))
+            yield from self.exchange_data(db_client, exchange, start, stop)
 
-        def update_balance(_c: str, _q: float, _jpy: Optional[float]):
-            return self.update_balance(_c, doc_time, _q, _jpy)
+    def merge_data(self, exchanges: Sequence[str], start: datetime, stop: datetime):
+        """
+        documents of all exchanges in the order of the pl collection, (time, exchange, kind, id),
+        merged from the converted collections without importing them into pl.
+        """
+        db_client = pymongo.MongoClient()
+        yield from heapq.merge(*[self.exchange_data(db_client, exchange, start, stop)
+                                 for exchange in sorted(exchanges)], key=doc_key)
 
-        pnl = .0
-        if kind in ('jpy_deposit', 'jpy_withdrawal'):
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                # incomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                # outcomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind in ('deposit', 'withdrawal'):
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                # incomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                # outcomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind in ('margin_deposit', 'margin_withdrawal',):
-            assert not fees
-            for currency, qty in doc['incomes']:
-                rate = self.get_rate(currency, doc_time)
-                v = incomes[currency] = update_balance(currency, qty, qty * rate)
-                pnl += v['jpy']
-            for currency, qty in doc['outcomes']:
-                v = outcomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind == 'margin_transfer':
-            assert False
-        elif kind in ('spot', 'spot_fee'):
-            instrument = doc['instrument']
-            base, quote = instrument.split('/')
-            base = self.CURRENCY_MAP.get(base, base)
-            quote = self.CURRENCY_MAP.get(quote, quote)
-            side = doc['side']
-            if side == 'BUY':
-                income_currency = base
-                outcome_currency = quote
-            else:
-                income_currency = quote
-                outcome_currency = base
-            assert base in self.CRYPTO_CURRENCIES
-            if quote in self.FIAT_CURRENCIES:
-                if side == 'BUY':
-                    for currency, qty in doc['incomes']:
-                        assert currency == income_currency
-                        assert currency not in incomes
-                        incomes[currency] = update_balance(currency, qty, 0)
-                    for currency, qty in doc['outcomes']:
-                        assert currency == outcome_currency
-                        assert currency not in outcomes
-                        outcomes[currency] = v = update_balance(currency, qty, None)
-                        v = self.update_balance(income_currency, doc_time, 0, abs(v['jpy']))
-                        incomes[income_currency]['jpy'] += v['jpy']
-                else:
-                    for currency, qty in doc['incomes']:
-                        assert currency == income_currency
-                        assert currency not in incomes
-                        v = incomes[currency] = update_balance(currency, qty, None)
-                        pnl += v['jpy']
-                    for currency, qty in doc['outcomes']:
-                        assert currency == outcome_currency
-                        assert currency not in outcomes
-                        v = outcomes[currency] = update_balance(currency, qty, None)
-                        pnl += v['jpy']
-            else:
-                for currency, qty in doc['incomes']:
-                    assert currency == income_currency
-                    assert currency not in incomes
-                    v = incomes[currency] = update_balance(currency, qty, None)
-                    pnl += v['jpy']
-                for currency, qty in doc['outcomes']:
-                    assert currency == outcome_currency
-                    assert currency not in outcomes
-                    v = outcomes[currency] = update_balance(currency, qty, None)
-                    pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = update_balance(currency, qty, None)
-                fees[currency] = v
-                update_balance(income_currency, 0, abs(v['jpy']))
+    def exchange_data(self, db_client: pymongo.MongoClient, exchange: str, start: datetime, stop: datetime):
+        start_after = start
+        collection = db_client[exchange]['converted']
+        # sorted by the (time, kind, id) index. kind changes in convert_doc, so documents of the same time
+        # are sorted again.
+        same_time = []
+        for doc in collection.find({'time': {'$gt': start_after, '$lt': stop}},
+                                   {'_id': 0}).sort([('time', 1), ('kind', 1), ('id', 1)]):
+            doc = self.convert_doc(exchange, doc)
+            if not doc:
+                continue
+            if same_time and same_time[0]['time'] != doc['time']:
+                yield from sorted(same_time, key=doc_key)
+                same_time = []
+            same_time.append(doc)
+        yield from sorted(same_time, key=doc_key)
+
+    def convert_doc(self, exchange: str, doc: dict) -> Optional[dict]:
+        assert '_id' not in doc
+        if doc.get('skip'):
+            return None
+        kind = doc['kind']
+        assert len(doc['pnl']) > 0
+        if isinstance(doc['pnl'][0], str):
+            pnl_list = [doc['pnl']]
         else:
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                v = incomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                v = outcomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        # assert incomes or outcomes or fees
-        for v in list(self.balances.values()) + list(self.debt_balances.values()):
-            if v['qty']:
-                v['price'] = v['jpy'] / v['qty']
-        self.balances['pnl']['jpy'] += pnl
-        return dict(time=doc_time,
-                    exchange=doc['exchange'],
-                    kind=kind,
-                    id=doc['id'],
-                    instrument=instrument,
-                    side=side,
-                    _incomes=incomes,
-                    _outcomes=outcomes,
-                    _fees=fees,
-                    __incomes=doc['incomes'],
-                    __outcomes=doc['outcomes'],
-                    __fees=doc['fees'],
-                    pnl=pnl,
-                    balances=self.balances,
-                    debt_balances=self.debt_balances)
+            pnl_list = doc['pnl']
+        currencies = list(set([self.CURRENCY_MAP.get(_[0], _[0]) for _ in pnl_list]))
+        for _ in currencies:
+            assert _ in self.SUPPORTED_CURRENCIES, (_, self.SUPPORTED_CURRENCIES)
+        incomes = defaultdict(float)
+        outcomes = defaultdict(float)
+        fees = defaultdict(float)
+        for currency, qty, note in pnl_list:
+            if not qty:
+                continue
+            currency = self.CURRENCY_MAP.get(currency, currency)
+            if 'fee' in note:
+                assert qty < 0
+                fees[currency] += qty
+            elif qty > 0:
+                assert 'fee' not in note
+                incomes[currency] += qty
+            elif qty < 0:
+                assert 'fee' not in note
+                outcomes[currency] += qty
+            else:
+                assert False, doc
+        if kind in ('deposit', 'withdrawal'):
+            if list(currencies) == ['JPY']:
+                kind = 'jpy_{}'.format(kind)
+        incomes = list(sorted(incomes.items()))
+        outcomes = list(sorted(outcomes.items()))
+        fees = list(sorted(fees.items()))
+        doc.update(kind=kind, exchange=exchange,
+                   incomes=incomes, outcomes=outcomes, fees=fees)
+        del doc['pnl']
+        return doc
+
+    def ma_engine(self, policy: MAPolicy) -> MovingAverageEngine:
+        if policy not in self._ma_engines:
+            self._ma_engines[policy] = MovingAverageEngine(self, policy)
+        return self._ma_engines[policy]
 
     def update_balance(self, currency: str, doc_time: datetime, qty: float, jpy: Optional[float]):
         balance = self.balances[currency]
-        pre_qty = balance['qty']
-        pre_jpy = balance['jpy']
+        pre_qty = balance.qty
+        pre_jpy = balance.jpy
         debt_qty = 0
         debt_jpy = 0
         rate_note = None
 
         assert isinstance(qty, float) or isinstance(jpy, float)
 
-        balance['qty'] += qty
+        balance.qty += qty
         if isinstance(qty, (int, float)) and isinstance(jpy, (int, float)):
-            balance['jpy'] += jpy
-        elif balance['qty'] >= 0:
+            balance.jpy += jpy
+        elif balance.qty >= 0:
             if qty < 0:
                 assert jpy is None, jpy
                 rate = qty / pre_qty
-                jpy = balance['jpy'] * rate
+                jpy = balance.jpy * rate
                 rate_note = (currency, None, jpy / qty)
             else:
                 if jpy is None:
@@ -335,330 +269,31 @@ class Calculator:
                     rate_note = (currency, doc_time, rate)
                     jpy = qty * rate
                 assert jpy is not None
-            balance['jpy'] += jpy
+            balance.jpy += jpy
         else:
             debt = self.debt_balances[currency]
-            debt_qty = balance['qty']
+            debt_qty = balance.qty
             rate = self.get_rate(currency, doc_time)
             rate_note = (currency, doc_time, rate)
-            debt_jpy = balance['qty'] * rate
-            debt['qty'] += debt_qty
-            debt['jpy'] += debt_jpy
-            balance['qty'] = balance['jpy'] = .0
-        qty = balance['qty'] - pre_qty + debt_qty
-        jpy = balance['jpy'] - pre_jpy + debt_jpy
-        if balance['qty']:
-            balance['price'] = balance['jpy'] / balance['qty']
-        else:
-            balance['price'] = float('nan')
+            debt_jpy = balance.qty * rate
+            debt.qty += debt_qty
+            debt.jpy += debt_jpy
+            balance.qty = balance.jpy = .0
+        qty = balance.qty - pre_qty + debt_qty
+        jpy = balance.jpy - pre_jpy + debt_jpy
         return dict(qty=qty, jpy=jpy, rates=rate_note)
 
-    def calculate_ma(self, doc: dict):
-        doc_time = doc['time']
-        kind = doc['kind']
-        instrument = ''
-        side = ''
-        incomes = defaultdict(lambda: dict(qty=.0, jpy=.0))
-        outcomes = defaultdict(lambda: dict(qty=.0, jpy=.0))
-        fees = defaultdict(lambda: dict(qty=.0, jpy=.0))
-
-        def update_balance(_c: str, _q: float, _jpy: Optional[float]):
-            if _c == 'JPY':
-                return dict(qty=_q, jpy=_q)
-            return self.update_balance(_c, doc_time, _q, _jpy)
+    @metrics.timer('calculate_ma_old')
+    def calculate_ma_old(self, doc: dict):
+        return self.ma_engine(MA_OLD).calculate(doc)
 
-        pnl = .0
-        if kind in ('jpy_deposit', 'jpy_withdrawal'):
-            if not doc['fees']:
-                return
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                # incomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                # outcomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind in ('deposit', 'withdrawal', 'withdrawal_fee'):
-            if not doc['fees']:
-                return
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                # incomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                # outcomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind in ('margin_deposit', 'margin_withdrawal',):
-            assert not fees
-            for currency, qty in doc['incomes']:
-                rate = self.get_rate(currency, doc_time)
-                v = incomes[currency] = update_balance(currency, qty, qty * rate)
-                pnl += v['jpy']
-            for currency, qty in doc['outcomes']:
-                v = outcomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind == 'margin_transfer':
-            assert False
-        elif kind in ('spot', 'spot_fee'):
-            instrument = doc['instrument']
-            base, quote = instrument.split('/')
-            base = self.CURRENCY_MAP.get(base, base)
-            quote = self.CURRENCY_MAP.get(quote, quote)
-            side = doc['side']
-            if side == 'BUY':
-                income_currency = base
-                outcome_currency = quote
-            else:
-                income_currency = quote
-                outcome_currency = base
-            assert base in self.CRYPTO_CURRENCIES
-            if quote in self.FIAT_CURRENCIES and quote == 'JPY':
-                if side == 'BUY':
-                    for currency, qty in doc['incomes']:
-                        assert currency == income_currency
-                        assert currency not in incomes
-                        incomes[currency] = update_balance(currency, qty, 0)
-                    for currency, qty in doc['outcomes']:
-                        assert currency == outcome_currency
-                        assert currency not in outcomes
-                        outcomes[currency] = v = update_balance(currency, qty, None)
-                        v = self.update_balance(income_currency, doc_time, 0, abs(v['jpy']))
-                        incomes[income_currency]['jpy'] += v['jpy']
-                    for currency, qty in doc['fees']:
-                        assert currency not in fees
-                        v = update_balance(currency, qty, None)
-                        assert v['jpy'] <= 0
-                        fees[currency] = v
-                        update_balance(income_currency, 0, abs(v['jpy']))
-                else:
-                    for currency, qty in doc['incomes']:
-                        assert currency == income_currency
-                        assert currency not in incomes
-                        v = incomes[currency] = update_balance(currency, qty, None)
-                        pnl += v['jpy']
-                    for currency, qty in doc['outcomes']:
-                        assert currency == outcome_currency
-                        assert currency not in outcomes
-                        v = outcomes[currency] = update_balance(currency, qty, None)
-                        pnl += v['jpy']
-                    for currency, qty in doc['fees']:
-                        assert currency not in fees
-                        v = update_balance(currency, qty, None)
-                        fees[currency] = v
-                        assert v['jpy'] <= 0
-                        pnl += v['jpy']
-                        # update_balance(income_currency, 0, abs(v['jpy']))
-            else:
-                for currency, qty in doc['incomes']:
-                    assert currency == income_currency
-                    assert currency not in incomes
-                    v = incomes[currency] = update_balance(currency, qty, None)
-                    pnl += v['jpy']
-                for currency, qty in doc['outcomes']:
-                    assert currency == outcome_currency
-                    assert currency not in outcomes
-                    v = outcomes[currency] = update_balance(currency, qty, None)
-                    pnl += v['jpy']
-                for currency, qty in doc['fees']:
-                    assert currency not in fees
-                    v = update_balance(currency, qty, None)
-                    fees[currency] = v
-                    update_balance(income_currency, 0, abs(v['jpy']))
-        else:
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                v = incomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                v = outcomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        # assert incomes or outcomes or fees
-        for v in list(self.balances.values()) + list(self.debt_balances.values()):
-            if v['qty']:
-                v['price'] = v['jpy'] / v['qty']
-        self.pnl += pnl
-        return dict(time=doc_time,
-                    exchange=doc['exchange'],
-                    kind=kind,
-                    id=doc['id'],
-                    instrument=instrument,
-                    side=side,
-                    _incomes=incomes,
-                    _outcomes=outcomes,
-                    _fees=fees,
-                    pnl=self.pnl,
-                    pnl_delta=pnl,
-                    balances=self.balances,
-                    debt_balances=self.debt_balances)
+    @metrics.timer('calculate_ma')
+    def calculate_ma(self, doc: dict):
+        return self.ma_engine(MA).calculate(doc)
 
+    @metrics.timer('calculate_ma2')
     def calculate_ma2(self, doc: dict):
-        doc_time = doc['time']
-        kind = doc['kind']
-        instrument = ''
-        side = ''
-        incomes = defaultdict(lambda: dict(qty=.0, jpy=.0))
-        outcomes = defaultdict(lambda: dict(qty=.0, jpy=.0))
-        fees = defaultdict(lambda: dict(qty=.0, jpy=.0))
-
-        def update_balance(_c: str, _q: float, _jpy: Optional[float]):
-            if _c == 'JPY':
-                self.update_balance(_c, doc_time, _q, _q)
-                return dict(qty=_q, jpy=_q)
-            return self.update_balance(_c, doc_time, _q, _jpy)
-
-        pnl = .0
-        if kind in ('jpy_deposit', 'jpy_withdrawal'):
-            if not doc['fees']:
-                return
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                # incomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                # outcomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind in ('deposit', 'withdrawal', 'withdrawal_fee'):
-            if not doc['fees']:
-                return
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                # incomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                # outcomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind in ('margin_deposit', 'margin_withdrawal',):
-            assert not fees
-            for currency, qty in doc['incomes']:
-                rate = self.get_rate(currency, doc_time)
-                v = incomes[currency] = update_balance(currency, qty, qty * rate)
-                pnl += v['jpy']
-            for currency, qty in doc['outcomes']:
-                v = outcomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind == 'margin_transfer':
-            assert False
-        elif kind in ('spot', 'spot_fee'):
-            instrument = doc['instrument']
-            base, quote = instrument.split('/')
-            base = self.CURRENCY_MAP.get(base, base)
-            quote = self.CURRENCY_MAP.get(quote, quote)
-            side = doc['side']
-            if side == 'BUY':
-                income_currency = base
-                outcome_currency = quote
-            else:
-                income_currency = quote
-                outcome_currency = base
-            assert base in self.CRYPTO_CURRENCIES
-            if quote in self.FIAT_CURRENCIES and quote == 'JPY':
-                if side == 'BUY':
-                    for currency, qty in doc['incomes']:
-                        assert currency == income_currency
-                        assert currency not in incomes
-                        incomes[currency] = update_balance(currency, qty, 0)
-                    for currency, qty in doc['outcomes']:
-                        assert currency == outcome_currency
-                        assert currency not in outcomes
-                        outcomes[currency] = v = update_balance(currency, qty, None)
-                        v = self.update_balance(income_currency, doc_time, 0, abs(v['jpy']))
-                        incomes[income_currency]['jpy'] += v['jpy']
-                    for currency, qty in doc['fees']:
-                        assert currency not in fees
-                        v = update_balance(currency, qty, None)
-                        assert v['jpy'] <= 0
-                        fees[currency] = v
-                        update_balance(income_currency, 0, abs(v['jpy']))
-                else:
-                    for currency, qty in doc['incomes']:
-                        assert currency == income_currency
-                        assert currency not in incomes
-                        v = incomes[currency] = update_balance(currency, qty, None)
-                        pnl += v['jpy']
-                    for currency, qty in doc['outcomes']:
-                        assert currency == outcome_currency
-                        assert currency not in outcomes
-                        v = outcomes[currency] = update_balance(currency, qty, None)
-                        pnl += v['jpy']
-                    for currency, qty in doc['fees']:
-                        assert currency not in fees
-                        v = update_balance(currency, qty, None)
-                        fees[currency] = v
-                        assert v['jpy'] <= 0
-                        pnl += v['jpy']
-                        # update_balance(income_currency, 0, abs(v['jpy']))
-            else:
-                for currency, qty in doc['incomes']:
-                    assert currency == income_currency
-                    assert currency not in incomes
-                    v = incomes[currency] = update_balance(currency, qty, None)
-                    pnl += v['jpy']
-                for currency, qty in doc['outcomes']:
-                    assert currency == outcome_currency
-                    assert currency not in outcomes
-                    v = outcomes[currency] = update_balance(currency, qty, None)
-                    pnl += v['jpy']
-                for currency, qty in doc['fees']:
-                    assert currency not in fees
-                    v = update_balance(currency, qty, None)
-                    fees[currency] = v
-                    update_balance(income_currency, 0, abs(v['jpy']))
-        else:
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                v = incomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                v = outcomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        # assert incomes or outcomes or fees
-        for v in list(self.balances.values()) + list(self.debt_balances.values()):
-            if v['qty']:
-                v['price'] = v['jpy'] / v['qty']
-        self.pnl += pnl
-        return dict(time=doc_time,
-                    exchange=doc['exchange'],
-                    kind=kind,
-                    id=doc['id'],
-                    instrument=instrument,
-                    side=side,
-                    _incomes=incomes,
-                    _outcomes=outcomes,
-                    _fees=fees,
-                    pnl=self.pnl,
-                    pnl_delta=pnl,
-                    balances=self.balances,
-                    debt_balances=self.debt_balances)
+        return self.ma_engine(MA2).calculate(doc)
 
     def ga(self, doc: dict):
         doc_time = doc['time']
@@ -802,10 +437,6 @@ class Calculator:
                 # v = fees[currency] = update_balance(currency, qty, None)
                 # pnl += v['jpy']
         # assert incomes or outcomes or fees
-        for v in list(self.ga_costs.values()):
-            if v['qty']:
-                v['price'] = v['jpy'] / v['qty']
-            v['remain'] = v['qty']
         self.ga_costs['JPY']['price'] = 1.0
         return dict(time=doc_time,
                     exchange=doc['exchange'],
@@ -822,6 +453,7 @@ class Calculator:
                     costs=self.ga_costs,
                     outcomes=self.ga_outcomes)
 
+    @metrics.timer('calculate_ga_prepare')
     def calculate_ga_prepare(self, doc: dict):
         doc_time = doc['time']
         kind = doc['kind']
@@ -960,10 +592,6 @@ class Calculator:
                 # v = fees[currency] = update_balance(currency, qty, None)
                 # pnl += v['jpy']
         # assert incomes or outcomes or fees
-        for v in list(self.ga_costs.values()):
-            if v['qty']:
-                v['price'] = v['jpy'] / v['qty']
-            v['remain'] = v['qty']
         self.ga_costs['JPY']['price'] = 1.0
         return dict(time=doc_time,
                     exchange=doc['exchange'],
@@ -979,6 +607,7 @@ class Calculator:
                     __fees=doc['fees'],
                     costs=self.ga_costs)
 
+    @metrics.timer('calculate_ga')
     def calculate_ga(self, doc: dict):
         doc_time = doc['time']
         kind = doc['kind']
@@ -1150,158 +779,6 @@ class Calculator:
                     pnl=self.pnl,
                     pnl_delta=pnl)
 
+    @metrics.timer('calculate_simple')
     def calculate_simple(self, doc: dict):
-        doc_time = doc['time']
-        kind = doc['kind']
-        instrument = ''
-        side = ''
-        incomes = defaultdict(lambda: dict(qty=.0, jpy=.0))
-        outcomes = defaultdict(lambda: dict(qty=.0, jpy=.0))
-        fees = defaultdict(lambda: dict(qty=.0, jpy=.0))
-
-        def update_balance(_c: str, _q: float, _jpy: Optional[float]):
-            if _c == 'JPY':
-                return dict(qty=_q, jpy=_q)
-            return self.update_balance(_c, doc_time, _q, _jpy)
-
-        pnl = .0
-        if kind in ('jpy_deposit', 'jpy_withdrawal'):
-            if not doc['fees']:
-                return
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                # incomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                # outcomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind in ('deposit', 'withdrawal'):
-            if not doc['fees']:
-                return
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                # incomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                # outcomes[currency] = update_balance(currency, qty, None)
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind in ('margin_deposit', 'margin_withdrawal',):
-            assert not fees
-            for currency, qty in doc['incomes']:
-                rate = self.get_rate(currency, doc_time)
-                v = incomes[currency] = update_balance(currency, qty, qty * rate)
-                pnl += v['jpy']
-            for currency, qty in doc['outcomes']:
-                v = outcomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        elif kind == 'margin_transfer':
-            assert False
-        elif kind in ('spot', 'spot_fee'):
-            instrument = doc['instrument']
-            base, quote = instrument.split('/')
-            base = self.CURRENCY_MAP.get(base, base)
-            quote = self.CURRENCY_MAP.get(quote, quote)
-            side = doc['side']
-            if side == 'BUY':
-                income_currency = base
-                outcome_currency = quote
-            else:
-                income_currency = quote
-                outcome_currency = base
-            assert base in self.CRYPTO_CURRENCIES
-            if quote in self.FIAT_CURRENCIES and quote == 'JPY':
-                if side == 'BUY':
-                    for currency, qty in doc['incomes']:
-                        assert currency == income_currency
-                        assert currency not in incomes
-                        incomes[currency] = update_balance(currency, qty, 0)
-                    for currency, qty in doc['outcomes']:
-                        assert currency == outcome_currency
-                        assert currency not in outcomes
-                        outcomes[currency] = v = update_balance(currency, qty, None)
-                        v = self.update_balance(income_currency, doc_time, 0, abs(v['jpy']))
-                        incomes[income_currency]['jpy'] += v['jpy']
-                    for currency, qty in doc['fees']:
-                        assert currency not in fees
-                        v = update_balance(currency, qty, None)
-                        assert v['jpy'] <= 0
-                        fees[currency] = v
-                        update_balance(income_currency, 0, abs(v['jpy']))
-                else:
-                    for currency, qty in doc['incomes']:
-                        assert currency == income_currency
-                        assert currency not in incomes
-                        v = incomes[currency] = update_balance(currency, qty, None)
-                        pnl += v['jpy']
-                    for currency, qty in doc['outcomes']:
-                        assert currency == outcome_currency
-                        assert currency not in outcomes
-                        v = outcomes[currency] = update_balance(currency, qty, None)
-                        pnl += v['jpy']
-                    for currency, qty in doc['fees']:
-                        assert currency not in fees
-                        v = update_balance(currency, qty, None)
-                        fees[currency] = v
-                        assert v['jpy'] <= 0
-                        pnl += v['jpy']
-                        # update_balance(income_currency, 0, abs(v['jpy']))
-            else:
-                for currency, qty in doc['incomes']:
-                    assert currency == income_currency
-                    assert currency not in incomes
-                    v = incomes[currency] = update_balance(currency, qty, None)
-                    pnl += v['jpy']
-                for currency, qty in doc['outcomes']:
-                    assert currency == outcome_currency
-                    assert currency not in outcomes
-                    v = outcomes[currency] = update_balance(currency, qty, None)
-                    pnl += v['jpy']
-                for currency, qty in doc['fees']:
-                    assert currency not in fees
-                    v = update_balance(currency, qty, None)
-                    fees[currency] = v
-                    update_balance(income_currency, 0, abs(v['jpy']))
-        else:
-            for currency, qty in doc['incomes']:
-                assert currency not in incomes
-                v = incomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['outcomes']:
-                assert currency not in outcomes
-                v = outcomes[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-            for currency, qty in doc['fees']:
-                assert currency not in fees
-                v = fees[currency] = update_balance(currency, qty, None)
-                pnl += v['jpy']
-        # assert incomes or outcomes or fees
-        for v in list(self.balances.values()) + list(self.debt_balances.values()):
-            if v['qty']:
-                v['price'] = v['jpy'] / v['qty']
-        self.pnl += pnl
-        return dict(time=doc_time,
-                    exchange=doc['exchange'],
-                    kind=kind,
-                    id=doc['id'],
-                    instrument=instrument,
-                    side=side,
-                    _incomes=incomes,
-                    _outcomes=outcomes,
-                    _fees=fees,
-                    __incomes=doc['incomes'],
-                    __outcomes=doc['outcomes'],
-                    __fees=doc['fees'],
-                    pnl=self.pnl,
-                    pnl_delta=pnl,
-                    balances=self.balances,
-                    debt_balances=self.debt_balances)
+        return self.ma_engine(SIMPLE).calculate(doc)
@@ -0,0 +1,121 @@
+from typing import Dict, Iterator, List
+
+ROLES = (('_incomes', 'income'), ('_outcomes', 'outcome'), ('_fees', 'fee'))
+COLUMNS = ('time', 'exchange', 'kind', 'id', 'instrument', 'side',
+           'role', 'currency', 'qty', 'jpy', 'pnl_delta', 'pnl')
+
+
+def _import_pyarrow():
+    # optional dependency: pip install pyarrow
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise ImportError('pyarrow is required for Parquet/Arrow export (pip install pyarrow)')
+
+
+def read_rows(path: str) -> Iterator[dict]:
+    """rows of a file written by ColumnarWriter, one batch at a time"""
+    pa = _import_pyarrow()
+    if path.endswith(('.arrow', '.feather')):
+        reader = pa.ipc.open_file(path)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        batches = pa.parquet.ParquetFile(path).iter_batches()
+    for batch in batches:
+        yield from batch.to_pylist()
+
+
+class ColumnarWriter:
+    """
+    calculation results as a typed table, one row per document, role (income/outcome/fee) and currency.
+    documents without any currency leg get one row with empty role/currency.
+    pnl is the pnl of ma/ma2/ga results. ma_old results only have the document pnl, their pnl column
+    is its running total from pnl (the pnl of a resumed calculator).
+    written as Parquet, or Arrow IPC if the path ends with .arrow/.feather.
+    """
+    BATCH_SIZE = 65536
+
+    def __init__(self, path: str, batch_size: int = None, pnl: float = .0):
+        pa = self.pa = _import_pyarrow()
+        self.schema = pa.schema([
+            ('time', pa.timestamp('us', tz='UTC')),
+            ('exchange', pa.string()),
+            ('kind', pa.string()),
+            ('id', pa.string()),
+            ('instrument', pa.string()),
+            ('side', pa.string()),
+            ('role', pa.string()),
+            ('currency', pa.string()),
+            ('qty', pa.float64()),
+            ('jpy', pa.float64()),
+            ('pnl_delta', pa.float64()),
+            ('pnl', pa.float64()),
+        ])
+        if path.endswith(('.arrow', '.feather')):
+            self.writer = pa.ipc.new_file(path, self.schema)
+        else:
+            self.writer = pa.parquet.ParquetWriter(path, self.schema)
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.columns = {k: [] for k in COLUMNS}  # type: Dict[str, List]
+        self.n = 0
+        self.pnl = pnl
+
+    def write(self, result: dict):
+        if 'pnl_delta' in result:
+            pnl_delta = result['pnl_delta']
+            self.pnl = result['pnl']
+        else:
+            pnl_delta = result['pnl']
+            self.pnl += pnl_delta
+        legs = []
+        for key, role in ROLES:
+            for currency, v in sorted(result[key].items()):
+                legs.append((role, currency, v['qty'], v.get('jpy')))
+        if not legs:
+            legs.append(('', '', None, None))
+        columns = self.columns
+        for role, currency, qty, jpy in legs:
+            columns['time'].append(result['time'])
+            columns['exchange'].append(result['exchange'])
+            columns['kind'].append(result['kind'])
+            columns['id'].append(str(result['id']))
+            columns['instrument'].append(result['instrument'])
+            columns['side'].append(result['side'])
+            columns['role'].append(role)
+            columns['currency'].append(currency)
+            columns['qty'].append(qty)
+            columns['jpy'].append(jpy)
+            columns['pnl_delta'].append(pnl_delta)
+            columns['pnl'].append(self.pnl)
+        self.n += len(legs)
+        if self.n >= self.batch_size:
+            self.flush()
+
+    def write_row(self, row: dict):
+        """a row as read by read_rows, to copy rows of a previous file"""
+        for k in COLUMNS:
+            self.columns[k].append(row[k])
+        self.n += 1
+        if self.n >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.n:
+            return
+        table = self.pa.Table.from_pydict(self.columns, schema=self.schema)
+        self.writer.write_table(table)
+        for v in self.columns.values():
+            v.clear()
+        self.n = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,51 @@
+from datetime import datetime, time
+from typing import Iterable, List, Optional
+
+from coinapi.clientbase import ClientBase
+
+UTC = ClientBase.UTC
+JST = ClientBase.JST
+
+
+def to_jst(dt: datetime) -> datetime:
+    """datetimes read from MongoDB are naive UTC"""
+    return (dt if dt.tzinfo else UTC.localize(dt)).astimezone(JST)
+
+
+class FXCalendar:
+    """
+    closes of a daily candle collection (yahoo) indexed by JST day ordinal,
+    forward-filled over the days without a candle: weekends, holidays and the days after the last one.
+
+    close_before(dt) is the close find({'time': {'$lt': dt}}).sort('time', -1) returns,
+    looked up by index. candles must start at JST midnight.
+    """
+
+    def __init__(self, candles: Iterable[dict], key: str = 'c'):
+        self.first = None  # type: Optional[int]
+        self.closes = []  # type: List[float]
+        for candle in candles:
+            t = to_jst(candle['time'])
+            assert t.time() == time(0), ('not a JST daily candle', candle)
+            if self.first is None:
+                self.first = t.toordinal()
+            i = t.toordinal() - self.first
+            assert i >= len(self.closes) - 1, ('candles not in time order', candle)
+            if i == len(self.closes) - 1:
+                self.closes[i] = candle[key]
+                continue
+            self.closes.extend(self.closes[-1:] * (i - len(self.closes)))
+            self.closes.append(candle[key])
+
+    @classmethod
+    def load(cls, collection, key: str = 'c') -> 'FXCalendar':
+        return cls(collection.find({}, {'_id': 0, 'time': 1, key: 1}).sort('time', 1), key)
+
+    def close_before(self, dt: datetime) -> float:
+        t = to_jst(dt)
+        ordinal = t.toordinal()
+        if t.time() == time(0):
+            # the candle of the day starts at dt, it is not before it
+            ordinal -= 1
+        assert self.first is not None and ordinal >= self.first, ('no candle before', dt)
+        return self.closes[min(ordinal - self.first, len(self.closes) - 1)]
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import pathlib
+import pickle
+from typing import Iterable, List, Optional, Tuple
+
+from .snapshot import doc_key
+
+# fields of a pl document the calculation depends on, besides its key
+DIGEST_KEYS = ('incomes', 'outcomes', 'fees', 'instrument', 'side')
+PROJECTION = dict({k: 1 for k in DIGEST_KEYS}, time=1, exchange=1, kind=1, id=1, _id=0)
+
+
+def doc_digest(doc: dict) -> bytes:
+    values = [repr(doc.get(k)) for k in DIGEST_KEYS]
+    return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=16).digest()
+
+
+class Journal:
+    """
+    key and digest of every document processed by the last run of a method, and its final pnl.
+    comparing it with the pl collection finds the first document that changed since.
+    """
+
+    def __init__(self, directory: str, method: str):
+        self.path = pathlib.Path(directory) / '{}_journal.pickle'.format(method)
+        self.entries = []  # type: List[Tuple[tuple, bytes]]
+        self.pnl = None  # type: Optional[float]
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        with self.path.open('rb') as f:
+            data = pickle.load(f)
+        self.entries = data['entries']
+        self.pnl = data['pnl']
+        return True
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with tmp_path.open('wb') as f:
+            pickle.dump(dict(entries=self.entries, pnl=self.pnl), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(str(tmp_path), str(self.path))
+
+    def truncate(self, key: Optional[tuple]):
+        """keep the entries up to key (inclusive), all of them are dropped if key is None"""
+        if key is None:
+            self.entries = []
+        else:
+            self.entries = [x for x in self.entries if x[0] <= key]
+
+    def append(self, doc: dict):
+        self.entries.append((doc_key(doc), doc_digest(doc)))
+
+    def first_change(self, docs: Iterable[dict]) -> Optional[tuple]:
+        """
+        key of the first document added, removed or modified compared with the journal.
+        docs must be in the order of doc_key and have the time converted like the processed ones.
+        """
+        entries = iter(self.entries)
+        for doc in docs:
+            key = doc_key(doc)
+            entry = next(entries, None)
+            if entry is None:
+                return key
+            if entry[0] != key:
+                return min(entry[0], key)
+            if entry[1] != doc_digest(doc):
+                return key
+        entry = next(entries, None)
+        return entry and entry[0]
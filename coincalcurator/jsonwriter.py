@@ -0,0 +1,102 @@
+import json
+from typing import Callable, IO, Iterator, Optional
+
+FORMATS = ('json', 'ndjson')
+
+
+class JSONWriter:
+    """
+    write rows one by one as they are calculated.
+
+    the output is the same as json.dump(dict(key=rows, **fields), sort_keys=True, indent=4)
+    (or json.dump(rows, ...) when key is None), so fields must sort after key.
+    compact: no indentation and whitespace.
+    """
+
+    def __init__(self, f: IO[str], key: Optional[str] = 'history', *,
+                 compact: bool = False, default: Callable = None):
+        self.f = f
+        self.key = key
+        self.compact = compact
+        self.default = default
+        self.n = 0
+        self.indent = None if compact else 4
+        self.separators = (',', ':') if compact else (',', ': ')
+        self.row_prefix = '' if compact else ' ' * (8 if key else 4)
+
+    def dumps(self, obj) -> str:
+        return json.dumps(obj, sort_keys=True, indent=self.indent, separators=self.separators,
+                          default=self.default)
+
+    def newline(self, prefix: str) -> str:
+        return '' if self.compact else '\n' + prefix
+
+    def start(self):
+        if self.key:
+            self.f.write('{' + self.newline(' ' * 4) + json.dumps(self.key) + self.separators[1] + '[')
+        else:
+            self.f.write('[')
+
+    def write(self, row: dict):
+        if self.n == 0:
+            self.start()
+        else:
+            self.f.write(',')
+        prefix = self.row_prefix
+        self.f.write(self.newline(prefix) + self.dumps(row).replace('\n', '\n' + prefix))
+        self.n += 1
+
+    def finish(self, **fields):
+        if self.n == 0:
+            self.start()
+        elif not self.compact:
+            self.f.write('\n' + self.row_prefix[:-4])
+        self.f.write(']')
+        if not self.key:
+            assert not fields
+            return
+        for k in sorted(fields):
+            assert k > self.key, (k, self.key)
+            prefix = ' ' * 4
+            value = self.dumps(fields[k]).replace('\n', '\n' + prefix)
+            self.f.write(',' + self.newline(prefix) + json.dumps(k) + self.separators[1] + value)
+        self.f.write(self.newline('') + '}')
+
+
+class NDJSONWriter(JSONWriter):
+    """
+    one row per line. the envelope fields are not written, rows carry the running pnl
+    and the balances are written to *_result.json.
+    """
+
+    def __init__(self, f: IO[str], key: Optional[str] = 'history', *,
+                 compact: bool = False, default: Callable = None):
+        super().__init__(f, key, compact=compact, default=default)
+        self.indent = None
+        self.separators = (',', ':') if compact else (', ', ': ')
+
+    def write(self, row: dict):
+        self.f.write(self.dumps(row) + '\n')
+        self.n += 1
+
+    def finish(self, **fields):
+        pass
+
+
+def read_rows(f: IO[str], fmt: str = 'json', key: Optional[str] = 'history') -> Iterator[dict]:
+    """rows of a file written by json_writer. a json file is loaded at once, ndjson line by line"""
+    assert fmt in FORMATS, (fmt, FORMATS)
+    if fmt == 'ndjson':
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+        return
+    data = json.load(f)
+    yield from data[key] if key else data
+
+
+def json_writer(f: IO[str], fmt: str = 'json', key: Optional[str] = 'history', *,
+                compact: bool = False, default: Callable = None) -> JSONWriter:
+    assert fmt in FORMATS, (fmt, FORMATS)
+    writer_class = NDJSONWriter if fmt == 'ndjson' else JSONWriter
+    return writer_class(f, key, compact=compact, default=default)
@@ -0,0 +1,222 @@
+from datetime import datetime
+from typing import Optional, Sequence
+
+
+class MAPolicy:
+    """
+    differences between the moving average (移動平均法) variants.
+
+    jpy: how JPY legs are booked.
+        'average' JPY is a balance like any other currency
+        'skip'    JPY is not tracked, its jpy value is its qty
+        'cash'    JPY is tracked at book value 1.0
+    transfer_kinds: kinds of which only fees are booked
+    skip_feeless_transfers: no result for transfers without fees
+    fiat_quotes: quotes of spot trades whose BUY cost is taken from the quote outcome.
+        None means every fiat currency
+    fiat_fee_pnl: fees of fiat quoted SELL are realised as pnl instead of added to the income cost
+    cumulative_pnl: result pnl is the running total (and pnl_delta the document pnl)
+    raw_lists: result includes the document incomes/outcomes/fees as __incomes/__outcomes/__fees
+    """
+
+    def __init__(self, name: str, *, jpy: str, transfer_kinds: Sequence[str],
+                 skip_feeless_transfers: bool, fiat_quotes: Optional[Sequence[str]],
+                 fiat_fee_pnl: bool, cumulative_pnl: bool, raw_lists: bool):
+        assert jpy in ('average', 'skip', 'cash'), jpy
+        self.name = name
+        self.jpy = jpy
+        self.transfer_kinds = frozenset(transfer_kinds)
+        self.skip_feeless_transfers = skip_feeless_transfers
+        self.fiat_quotes = fiat_quotes and frozenset(fiat_quotes)
+        self.fiat_fee_pnl = fiat_fee_pnl
+        self.cumulative_pnl = cumulative_pnl
+        self.raw_lists = raw_lists
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.name)
+
+
+MA_OLD = MAPolicy('ma_old', jpy='average',
+                  transfer_kinds=('jpy_deposit', 'jpy_withdrawal', 'deposit', 'withdrawal'),
+                  skip_feeless_transfers=False, fiat_quotes=None, fiat_fee_pnl=False,
+                  cumulative_pnl=False, raw_lists=True)
+MA = MAPolicy('ma', jpy='skip',
+              transfer_kinds=('jpy_deposit', 'jpy_withdrawal', 'deposit', 'withdrawal', 'withdrawal_fee'),
+              skip_feeless_transfers=True, fiat_quotes=('JPY',), fiat_fee_pnl=True,
+              cumulative_pnl=True, raw_lists=False)
+MA2 = MAPolicy('ma2', jpy='cash',
+               transfer_kinds=('jpy_deposit', 'jpy_withdrawal', 'deposit', 'withdrawal', 'withdrawal_fee'),
+               skip_feeless_transfers=True, fiat_quotes=('JPY',), fiat_fee_pnl=True,
+               cumulative_pnl=True, raw_lists=False)
+SIMPLE = MAPolicy('simple', jpy='skip',
+                  transfer_kinds=('jpy_deposit', 'jpy_withdrawal', 'deposit', 'withdrawal'),
+                  skip_feeless_transfers=True, fiat_quotes=('JPY',), fiat_fee_pnl=True,
+                  cumulative_pnl=True, raw_lists=True)
+POLICIES = {x.name: x for x in (MA_OLD, MA, MA2, SIMPLE)}
+
+
+class MovingAverageEngine:
+    def __init__(self, calculator, policy: MAPolicy):
+        self.calculator = calculator
+        self.policy = policy
+        self.fiat_quotes = policy.fiat_quotes or frozenset(calculator.FIAT_CURRENCIES)
+        self.update = dict(average=self._update_average,
+                           skip=self._update_skip,
+                           cash=self._update_cash)[policy.jpy]
+        handlers = {}
+        for kind in policy.transfer_kinds:
+            handlers[kind] = self._transfer
+        handlers['margin_deposit'] = handlers['margin_withdrawal'] = self._margin
+        handlers['margin_transfer'] = self._unsupported
+        handlers['spot'] = handlers['spot_fee'] = self._spot
+        self.handlers = handlers
+
+    def _update_average(self, currency: str, doc_time: datetime, qty: float, jpy: Optional[float]):
+        return self.calculator.update_balance(currency, doc_time, qty, jpy)
+
+    def _update_skip(self, currency: str, doc_time: datetime, qty: float, jpy: Optional[float]):
+        if currency == 'JPY':
+            return dict(qty=qty, jpy=qty)
+        return self.calculator.update_balance(currency, doc_time, qty, jpy)
+
+    def _update_cash(self, currency: str, doc_time: datetime, qty: float, jpy: Optional[float]):
+        if currency == 'JPY':
+            self.calculator.update_balance(currency, doc_time, qty, qty)
+            return dict(qty=qty, jpy=qty)
+        return self.calculator.update_balance(currency, doc_time, qty, jpy)
+
+    def calculate(self, doc: dict):
+        doc_time = doc['time']
+        kind = doc['kind']
+        # filled by the handlers, each currency at most once per leg
+        incomes = {}
+        outcomes = {}
+        fees = {}
+        ret = self.handlers.get(kind, self._default)(doc, doc_time, incomes, outcomes, fees)
+        if ret is None:
+            return
+        pnl, instrument, side = ret
+
+        calculator = self.calculator
+        result = dict(time=doc_time,
+                      exchange=doc['exchange'],
+                      kind=kind,
+                      id=doc['id'],
+                      instrument=instrument,
+                      side=side,
+                      _incomes=incomes,
+                      _outcomes=outcomes,
+                      _fees=fees)
+        if self.policy.raw_lists:
+            result.update(__incomes=doc['incomes'], __outcomes=doc['outcomes'], __fees=doc['fees'])
+        if self.policy.cumulative_pnl:
+            calculator.pnl += pnl
+            result.update(pnl=calculator.pnl, pnl_delta=pnl)
+        else:
+            calculator.balances['pnl']['jpy'] += pnl
+            result.update(pnl=pnl)
+        result.update(balances=calculator.balances, debt_balances=calculator.debt_balances)
+        return result
+
+    def _transfer(self, doc: dict, doc_time: datetime, incomes: dict, outcomes: dict, fees: dict):
+        if self.policy.skip_feeless_transfers and not doc['fees']:
+            return
+        pnl = .0
+        for currency, qty in doc['fees']:
+            assert currency not in fees
+            v = fees[currency] = self.update(currency, doc_time, qty, None)
+            pnl += v['jpy']
+        return pnl, '', ''
+
+    def _margin(self, doc: dict, doc_time: datetime, incomes: dict, outcomes: dict, fees: dict):
+        get_rate = self.calculator.get_rate
+        update = self.update
+        pnl = .0
+        for currency, qty in doc['incomes']:
+            rate = get_rate(currency, doc_time)
+            v = incomes[currency] = update(currency, doc_time, qty, qty * rate)
+            pnl += v['jpy']
+        for currency, qty in doc['outcomes']:
+            v = outcomes[currency] = update(currency, doc_time, qty, None)
+            pnl += v['jpy']
+        for currency, qty in doc['fees']:
+            assert currency not in fees
+            v = fees[currency] = update(currency, doc_time, qty, None)
+            pnl += v['jpy']
+        return pnl, '', ''
+
+    def _unsupported(self, doc: dict, *_):
+        assert False, doc['kind']
+
+    def _spot(self, doc: dict, doc_time: datetime, incomes: dict, outcomes: dict, fees: dict):
+        calculator = self.calculator
+        currency_map = calculator.CURRENCY_MAP
+        update = self.update
+        instrument = doc['instrument']
+        base, quote = instrument.split('/')
+        base = currency_map.get(base, base)
+        quote = currency_map.get(quote, quote)
+        side = doc['side']
+        if side == 'BUY':
+            income_currency = base
+            outcome_currency = quote
+        else:
+            income_currency = quote
+            outcome_currency = base
+        assert base in calculator.CRYPTO_CURRENCIES
+
+        pnl = .0
+        fiat_quote = quote in self.fiat_quotes
+        if fiat_quote and side == 'BUY':
+            # cost of the base is the book value of the quote paid
+            for currency, qty in doc['incomes']:
+                assert currency == income_currency
+                assert currency not in incomes
+                incomes[currency] = update(currency, doc_time, qty, 0)
+            for currency, qty in doc['outcomes']:
+                assert currency == outcome_currency
+                assert currency not in outcomes
+                outcomes[currency] = v = update(currency, doc_time, qty, None)
+                v = calculator.update_balance(income_currency, doc_time, 0, abs(v['jpy']))
+                incomes.setdefault(income_currency, dict(qty=.0, jpy=.0))['jpy'] += v['jpy']
+        else:
+            for currency, qty in doc['incomes']:
+                assert currency == income_currency
+                assert currency not in incomes
+                v = incomes[currency] = update(currency, doc_time, qty, None)
+                pnl += v['jpy']
+            for currency, qty in doc['outcomes']:
+                assert currency == outcome_currency
+                assert currency not in outcomes
+                v = outcomes[currency] = update(currency, doc_time, qty, None)
+                pnl += v['jpy']
+
+        fee_pnl = fiat_quote and self.policy.fiat_fee_pnl
+        for currency, qty in doc['fees']:
+            assert currency not in fees
+            v = fees[currency] = update(currency, doc_time, qty, None)
+            if fee_pnl:
+                assert v['jpy'] <= 0
+                if side != 'BUY':
+                    pnl += v['jpy']
+                    continue
+            # fee is a part of the cost of what was bought
+            update(income_currency, doc_time, 0, abs(v['jpy']))
+        return pnl, instrument, side
+
+    def _default(self, doc: dict, doc_time: datetime, incomes: dict, outcomes: dict, fees: dict):
+        update = self.update
+        pnl = .0
+        for currency, qty in doc['incomes']:
+            assert currency not in incomes
+            v = incomes[currency] = update(currency, doc_time, qty, None)
+            pnl += v['jpy']
+        for currency, qty in doc['outcomes']:
+            assert currency not in outcomes
+            v = outcomes[currency] = update(currency, doc_time, qty, None)
+            pnl += v['jpy']
+        for currency, qty in doc['fees']:
+            assert currency not in fees
+            v = fees[currency] = update(currency, doc_time, qty, None)
+            pnl += v['jpy']
+        return pnl, '', ''
@@ -0,0 +1,110 @@
+from typing import Optional
+
+
+class Position:
+    """
+    qty and book value (jpy) of one currency.
+    price is derived on access, so nothing has to be recomputed after each document.
+    also readable/writable as a mapping (position['qty']) like the dicts used before.
+    """
+    __slots__ = ('qty', 'jpy')
+    FIELDS = ('qty', 'jpy', 'price')
+
+    def __init__(self, qty: float = .0, jpy: float = .0):
+        self.qty = qty
+        self.jpy = jpy
+
+    @property
+    def price(self) -> float:
+        if self.qty:
+            return self.jpy / self.qty
+        return float('nan')
+
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str):
+        return key in self.FIELDS
+
+    def update(self, **kwargs):
+        # price of loaded balances is derived, not restored
+        kwargs.pop('price', None)
+        for k, v in kwargs.items():
+            self[k] = v
+
+    def as_dict(self) -> dict:
+        return {k: self[k] for k in self.FIELDS}
+
+    def copy(self):
+        return self.__class__(self.qty, self.jpy)
+
+    def __eq__(self, other):
+        if isinstance(other, Position):
+            return self.as_dict() == other.as_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class CostPosition(Position):
+    """
+    position of the total average method.
+    remain is the qty not yet disposed of, equal to qty until the disposals are applied.
+    fixed_price overrides the average price (JPY is always 1.0).
+    """
+    __slots__ = ('_remain', 'fixed_price')
+    FIELDS = ('qty', 'jpy', 'price', 'remain')
+
+    def __init__(self, qty: float = .0, jpy: float = .0,
+                 remain: Optional[float] = None, fixed_price: Optional[float] = None):
+        super().__init__(qty, jpy)
+        self._remain = remain
+        self.fixed_price = fixed_price
+
+    @property
+    def price(self) -> float:
+        if self.fixed_price is not None:
+            return self.fixed_price
+        return super().price
+
+    @price.setter
+    def price(self, value: float):
+        self.fixed_price = value
+
+    @property
+    def remain(self) -> float:
+        if self._remain is None:
+            return self.qty
+        return self._remain
+
+    @remain.setter
+    def remain(self, value: float):
+        self._remain = value
+
+    def update(self, **kwargs):
+        kwargs.pop('remain', None)
+        super().update(**kwargs)
+
+    def copy(self):
+        return self.__class__(self.qty, self.jpy, self._remain, self.fixed_price)
+
+
+class Positions(dict):
+    def __init__(self, factory=Position):
+        super().__init__()
+        self.factory = factory
+
+    def __missing__(self, key: str):
+        self[key] = value = self.factory()
+        return value
+
+    def as_dict(self):
+        return {k: v.as_dict() for k, v in self.items()}
@@ -0,0 +1,186 @@
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pymongo
+
+from .fxcalendar import to_jst
+
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+# BASE/QUOTE_D daily candles of the exchanges, BASE/QUOTE daily closes of yahoo
+CANDLE_PATTERN = re.compile(r'^(?P<base>[A-Z0-9.]+)/(?P<quote>[A-Z0-9.]+)_D$')
+FX_PATTERN = re.compile(r'^(?P<base>[A-Z0-9.]+)/(?P<quote>[A-Z0-9.]+)$')
+
+
+def day_of(dt: datetime) -> int:
+    """JST day as days since 1970-01-01"""
+    return to_jst(dt).toordinal() - EPOCH_ORDINAL
+
+
+def days_of(times: np.ndarray) -> np.ndarray:
+    """day_of of naive UTC datetime64 times"""
+    jst = (times + np.timedelta64(9, 'h')).astype('datetime64[D]')
+    return (jst - np.datetime64('1970-01-01', 'D')).astype(int)
+
+
+class Edge:
+    """
+    daily rates of base in quote read from one candle collection.
+
+    direction next: the first candle from the previous day on, as get_crypto_rate reads _D candles.
+    direction previous: the last candle up to the previous day, as get_fiat_rate reads yahoo closes.
+    """
+
+    def __init__(self, base: str, quote: str, name: str, direction: str,
+                 days: np.ndarray, values: np.ndarray):
+        assert direction in ('next', 'previous'), direction
+        self.base = base
+        self.quote = quote
+        self.name = name
+        self.direction = direction
+        self.days = days
+        self.values = values
+
+    def __repr__(self):
+        return '<Edge {}/{} {} {}>'.format(self.base, self.quote, self.name, self.direction)
+
+    @classmethod
+    def load(cls, collection, base: str, quote: str, direction: str, key: str) -> 'Edge':
+        days, values = [], []
+        for candle in collection.find({key: {'$gt': 0}}, {'_id': 0, 'time': 1, key: 1}).sort('time', 1):
+            days.append(day_of(candle['time']))
+            values.append(candle[key])
+        name = '{}.{}'.format(collection.database.name, collection.name)
+        return cls(base, quote, name, direction, np.array(days, dtype=int), np.array(values, dtype=float))
+
+    def inverse(self) -> 'Edge':
+        return Edge(self.quote, self.base, self.name, self.direction, self.days, 1 / self.values)
+
+    def daily(self, days: np.ndarray):
+        """rates and staleness in days of the candle used for each day, staleness is inf without a candle"""
+        target = days - 1
+        rates = np.full(len(days), np.nan)
+        staleness = np.full(len(days), np.inf)
+        if not len(self.days):
+            return rates, staleness
+        if self.direction == 'next':
+            index = np.searchsorted(self.days, target, 'left')
+            valid = index < len(self.days)
+            index = np.minimum(index, len(self.days) - 1)
+            age = self.days[index] - target
+        else:
+            index = np.searchsorted(self.days, target, 'right') - 1
+            valid = index >= 0
+            index = np.maximum(index, 0)
+            age = target - self.days[index]
+        rates[valid] = self.values[index][valid]
+        staleness[valid] = age[valid]
+        return rates, staleness
+
+
+class RateGraph:
+    """
+    currency -> JPY rates per JST day through the cheapest path of the candle collections available.
+    the cost of a path is the number of conversions plus the staleness of their candles in days,
+    so a direct fresh pair wins over a chain and a chain wins over a stale pair.
+
+    the series of all currencies are composed at once on first use, one vector each
+    from the first to the last candle day.
+    """
+
+    def __init__(self, edges: Sequence[Edge], target: str = 'JPY'):
+        self.edges = list(edges)
+        self.target = target
+        self.directed = self.edges + [edge.inverse() for edge in self.edges]
+        all_days = [edge.days for edge in self.edges if len(edge.days)]
+        assert all_days, 'no candle'
+        self.first = int(min(days[0] for days in all_days))
+        self.last = int(max(days[-1] for days in all_days)) + 1
+        self._rates = None  # type: Optional[Dict[str, np.ndarray]]
+        self._via = None  # type: Optional[Dict[str, np.ndarray]]
+
+    @classmethod
+    def discover(cls, db_client: pymongo.MongoClient = None, fx_db: str = 'yahoo',
+                 target: str = 'JPY') -> 'RateGraph':
+        """edges of every _D collection of every database and every BASE/QUOTE collection of fx_db"""
+        db_client = db_client or pymongo.MongoClient()
+        edges = []
+        for db_name in sorted(db_client.list_database_names()):
+            if db_name in ('admin', 'config', 'local'):
+                continue
+            db = db_client[db_name]
+            for name in sorted(db.list_collection_names()):
+                m = CANDLE_PATTERN.match(name)
+                if m:
+                    edges.append(Edge.load(db[name], m.group('base'), m.group('quote'), 'next', 'vwap'))
+                    continue
+                m = FX_PATTERN.match(name)
+                if m and db_name == fx_db:
+                    edges.append(Edge.load(db[name], m.group('base'), m.group('quote'), 'previous', 'c'))
+        return cls(edges, target)
+
+    def resolve(self):
+        """Bellman-Ford over the currency graph, vectorized over the days"""
+        days = np.arange(self.first, self.last + 1)
+        daily = [edge.daily(days) for edge in self.directed]
+        currencies = {self.target} | {e.base for e in self.directed} | {e.quote for e in self.directed}
+        cost = {c: np.full(len(days), np.inf) for c in currencies}
+        rates = {c: np.full(len(days), np.nan) for c in currencies}
+        via = {c: np.full(len(days), -1) for c in currencies}
+        cost[self.target][:] = 0
+        rates[self.target][:] = 1.0
+        for _ in range(len(currencies)):
+            changed = False
+            for i, (edge, (edge_rates, staleness)) in enumerate(zip(self.directed, daily)):
+                if edge.base == self.target:
+                    continue
+                c = cost[edge.quote] + 1 + staleness
+                better = c < cost[edge.base]
+                if better.any():
+                    cost[edge.base][better] = c[better]
+                    rates[edge.base][better] = rates[edge.quote][better] * edge_rates[better]
+                    via[edge.base][better] = i
+                    changed = True
+            if not changed:
+                break
+        self._rates = rates
+        self._via = via
+
+    def series(self, currency: str) -> np.ndarray:
+        """rates of currency from day first to last, nan where no path exists"""
+        if self._rates is None:
+            self.resolve()
+        assert currency in self._rates, ('no candle of', currency)
+        return self._rates[currency]
+
+    def rate(self, currency: str, dt: datetime) -> float:
+        if currency == self.target:
+            return 1.0
+        day = day_of(dt)
+        assert self.first <= day <= self.last, (currency, dt, self.first, self.last)
+        rate = float(self.series(currency)[day - self.first])
+        assert rate == rate, ('no rate', currency, dt)
+        return rate
+
+    def rates(self, currency: str, times: np.ndarray) -> np.ndarray:
+        """rate of naive UTC datetime64 times at once"""
+        if currency == self.target:
+            return np.ones(len(times))
+        days = days_of(times)
+        assert not len(days) or self.first <= days.min() and days.max() <= self.last, (currency, days)
+        rates = self.series(currency)[days - self.first]
+        assert not np.isnan(rates).any(), ('no rate', currency)
+        return rates
+
+    def path(self, currency: str, dt: datetime) -> List[Edge]:
+        """edges the rate of currency at dt is composed of"""
+        self.series(currency)
+        i = day_of(dt) - self.first
+        edges = []
+        while currency != self.target:
+            assert self._via[currency][i] >= 0, ('no rate', currency, dt)
+            edge = self.directed[self._via[currency][i]]
+            edges.append(edge)
+            currency = edge.quote
+        return edges
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+from .rategraph import day_of
+
+COLLECTION = 'daily_jpy_rates'
+# how the rates of a row were read, rows without source are ROUTES
+ROUTES = 'routes'
+GRAPH = 'graph'
+# rates of a day are taken at its middle
+RATE_TIME = timedelta(hours=12)
+
+
+class RateTable:
+    """
+    rows of the daily_jpy_rates collection built by build_rate_table.py:
+    time (JST midnight), id (YYYYMMDD), source (ROUTES or GRAPH) and the JPY rate of each currency of the day.
+    get() returns None for a day or currency not in the table, the caller falls back to the candles.
+    """
+
+    def __init__(self, rows: Iterable[dict]):
+        self.rows = {}  # type: Dict[int, dict]
+        for row in rows:
+            self.rows[day_of(row['time'])] = row
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def load(cls, collection, source: str = ROUTES) -> 'RateTable':
+        """rows built from source only, the days built otherwise fall back to the candles"""
+        assert source in (ROUTES, GRAPH), source
+        query = {'source': {'$in': [None, ROUTES]}} if source == ROUTES else {'source': source}
+        return cls(collection.find(query, {'_id': 0}))
+
+    def get(self, currency: str, dt: datetime) -> Optional[float]:
+        row = self.rows.get(day_of(dt))
+        return row and row.get(currency)
+
+    @staticmethod
+    def build_row(day: datetime, currencies: Iterable[str],
+                  get_rate: Callable[[str, datetime], float], source: str = ROUTES) -> dict:
+        """row of the JST day starting at day, currencies without a rate are left out"""
+        row = dict(time=day, id='{:%Y%m%d}'.format(day), source=source)
+        for currency in sorted(currencies):
+            try:
+                row[currency] = get_rate(currency, day + RATE_TIME)
+            except AssertionError:
+                continue
+        return row
@@ -0,0 +1,122 @@
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+
+from .rategraph import day_of
+
+GRANULARITIES = {
+    'hourly': (lambda t: t.replace(minute=0, second=0, microsecond=0), relativedelta(hours=1)),
+    'daily': (lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0), relativedelta(days=1)),
+    'monthly': (lambda t: t.replace(day=1, hour=0, minute=0, second=0, microsecond=0), relativedelta(months=1)),
+}
+
+
+class ReportRow:
+    """
+    a closed bucket: realised pnl at its stop and the delta since the previous one,
+    unrealised pnl of the balances at its stop and the mark-to-market pnl of the bucket
+    (realised delta plus the change of the unrealised pnl).
+    """
+
+    def __init__(self, report: 'PnlReport', granularity: str, stop: datetime, pnl: float, delta: float,
+                 unrealised: float, m2m_delta: float):
+        self.report = report
+        self.granularity = granularity
+        self.stop = stop
+        self.pnl = pnl
+        self.delta = delta
+        self.unrealised = unrealised
+        self.m2m_delta = m2m_delta
+
+    @property
+    def start(self) -> datetime:
+        return self.stop - GRANULARITIES[self.granularity][1]
+
+    def summary(self) -> str:
+        return '# {} {}_pnl={:,.3f} delta={:,.3f} unrealised={:,.3f} m2m_delta={:,.3f}'.format(
+            self.stop, self.granularity, self.pnl, self.delta, self.unrealised, self.m2m_delta)
+
+    def value(self) -> Dict[str, dict]:
+        """mark-to-market value of the balances at the start of the bucket"""
+        return self.report.value(self.start)
+
+
+class PnlReport:
+    """
+    hourly/daily/monthly buckets of the realised and mark-to-market pnl of a calculation.
+
+    feed() is called before each document with the pnl so far and returns the buckets ended by then.
+    the balances are valued when feed() closes a bucket. all buckets closed by the same document
+    on the same JST day share one valuation (get_rate has one rate per day), so empty buckets and
+    further granularities do not add valuations. no granularity means no valuation at all.
+    valuations go through calculator.get_rate, whose rate of a day does not depend on who asks first,
+    so the report does not change the calculation (checked by benchmarks/report.py).
+    """
+
+    def __init__(self, calculator, granularities: Iterable[str] = ('hourly', 'daily')):
+        self.calculator = calculator
+        self.granularities = list(granularities)
+        for granularity in self.granularities:
+            assert granularity in GRANULARITIES, (granularity, list(GRANULARITIES))
+        self.stops = dict.fromkeys(self.granularities)  # type: Dict[str, Optional[datetime]]
+        self.pnls = dict.fromkeys(self.granularities, .0)
+        self.unrealised_pnls = dict.fromkeys(self.granularities, .0)
+        self.version = 0
+        self._values = {}  # type: Dict[Tuple[int, int], Dict[str, dict]]
+        self._unrealised = {}  # type: Dict[Tuple[int, int], float]
+
+    def feed(self, t: datetime, pnl: float) -> List[ReportRow]:
+        self.version += 1
+        rows = []
+        for granularity in self.granularities:
+            floor, length = GRANULARITIES[granularity]
+            if self.stops[granularity] is None:
+                self.stops[granularity] = floor(t) + length
+                self.pnls[granularity] = pnl
+                self.unrealised_pnls[granularity] = self.unrealised(floor(t))
+            while self.stops[granularity] <= t:
+                stop = self.stops[granularity]
+                delta = pnl - self.pnls[granularity]
+                unrealised = self.unrealised(stop)
+                m2m_delta = delta + unrealised - self.unrealised_pnls[granularity]
+                rows.append(ReportRow(self, granularity, stop, pnl, delta, unrealised, m2m_delta))
+                self.pnls[granularity] = pnl
+                self.unrealised_pnls[granularity] = unrealised
+                self.stops[granularity] += length
+        return rows
+
+    def unrealised(self, dt: datetime) -> float:
+        """market value minus book value of the balances and debts at dt"""
+        key = (self.version, day_of(dt))
+        if key not in self._unrealised:
+            self._unrealised.clear()
+            calculator = self.calculator
+            debt_balances = calculator.debt_balances
+            total = .0
+            for currency, balance in calculator.balances.items():
+                if currency == 'pnl':
+                    # realised pnl of ma_old
+                    continue
+                qty = balance.qty
+                book = balance.jpy
+                if currency in debt_balances:
+                    debt = debt_balances[currency]
+                    qty += debt.qty
+                    book += debt.jpy
+                if qty:
+                    total += calculator.get_rate(currency, dt) * qty
+                total -= book
+            self._unrealised[key] = total
+        return self._unrealised[key]
+
+    def value(self, dt: datetime) -> Dict[str, dict]:
+        key = (self.version, day_of(dt))
+        if key not in self._values:
+            self._values.clear()
+            self._values[key] = self.calculator.get_current_value(dt)
+        return self._values[key]
+
+    def output(self, rows: List[ReportRow], message: Callable[[str, object], None]):
+        for row in rows:
+            message(row.summary(), row.value)
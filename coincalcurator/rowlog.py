@@ -0,0 +1,79 @@
+import sys
+from pprint import pprint
+from typing import Callable, IO, Union
+
+LEVELS = ('quiet', 'summary', 'full')
+
+
+def has_debt(result: dict) -> bool:
+    """the calculation result leaves a negative balance, for RowLogger.row(negative=...)"""
+    return any(v['qty'] < 0 for v in result.get('debt_balances', {}).values())
+
+
+class RowLogger:
+    """
+    per-row output of the calculation loops.
+
+    level:
+        quiet    nothing per row
+        summary  one header/summary line per row
+        full     summary and the pretty-printed row (previous behaviour)
+    every: only every Nth row
+    negative_only: only rows with a negative balance
+    """
+
+    def __init__(self, level: str = 'full', every: int = 1, negative_only: bool = False,
+                 stream: IO[str] = None):
+        assert level in LEVELS, (level, LEVELS)
+        assert every >= 1, every
+        self.level = level
+        self.every = every
+        self.negative_only = negative_only
+        self.stream = stream or sys.stdout
+
+    @property
+    def quiet(self) -> bool:
+        return self.level == 'quiet'
+
+    def enabled(self, i: int) -> bool:
+        return not self.quiet and i % self.every == 0
+
+    def row(self, i: int, summary: str = '', obj=None,
+            negative: Union[bool, Callable[[], bool]] = False):
+        """
+        negative may be a callable, it is only evaluated when the row is output or filtered by it.
+        obj may be a callable, it is only evaluated at level full.
+        """
+        if not self.enabled(i):
+            return
+        if callable(negative):
+            negative = negative()
+        if self.negative_only and not negative:
+            return
+        print('#{}{}'.format(i, ' negative' if negative else ''), file=self.stream)
+        if summary:
+            print(summary, file=self.stream)
+        if self.level == 'full' and obj is not None:
+            pprint(obj() if callable(obj) else obj, stream=self.stream)
+
+    def trace(self, i: int, obj):
+        """intermediate output of a row, level full only"""
+        if self.level == 'full' and self.enabled(i) and not self.negative_only:
+            obj = obj() if callable(obj) else obj
+            if isinstance(obj, str):
+                print(obj, file=self.stream)
+            else:
+                pprint(obj, stream=self.stream)
+
+    def message(self, summary: str, obj=None):
+        """periodic or final output, not sampled"""
+        if self.quiet:
+            return
+        print(summary, file=self.stream)
+        if self.level == 'full' and obj is not None:
+            pprint(obj() if callable(obj) else obj, stream=self.stream)
+
+    @classmethod
+    def from_args(cls, args: dict) -> 'RowLogger':
+        level = 'quiet' if args['--quiet'] else args['--log']
+        return cls(level, int(args['--log-every']), args['--log-negative'])
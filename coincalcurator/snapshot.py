@@ -0,0 +1,95 @@
+import hashlib
+import os
+import pathlib
+import pickle
+from typing import Optional
+
+import pytz
+
+# documents of the pl collection are ordered by its unique index
+SORT_KEYS = ('time', 'exchange', 'kind', 'id')
+SORT = [(k, 1) for k in SORT_KEYS]
+VERSION = 1
+
+
+def doc_key(doc: dict) -> tuple:
+    return tuple(doc[k] for k in SORT_KEYS)
+
+
+class SnapshotStore:
+    """
+    pickled Calculator states taken after a document, one file per snapshot.
+    file names sort by the time of the document so the newest snapshot before a time is found
+    without loading the others.
+    """
+
+    def __init__(self, directory: str, method: str):
+        self.directory = pathlib.Path(directory)
+        self.method = method
+
+    def prefix(self, key: tuple) -> str:
+        return '{}_{:%Y%m%dT%H%M%S%f}'.format(self.method, key[0].astimezone(pytz.UTC))
+
+    def path(self, key: tuple) -> pathlib.Path:
+        digest = hashlib.blake2b(repr(key[1:]).encode(), digest_size=4).hexdigest()
+        return self.directory / '{}_{}.pickle'.format(self.prefix(key), digest)
+
+    def paths(self):
+        return sorted(self.directory.glob('{}_*.pickle'.format(self.method)))
+
+    def save(self, calculator, key: tuple):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with tmp_path.open('wb') as f:
+            pickle.dump(dict(version=VERSION, method=self.method, key=key, state=calculator.state()),
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(str(tmp_path), str(path))
+
+    @staticmethod
+    def load(path: pathlib.Path) -> dict:
+        with path.open('rb') as f:
+            snapshot = pickle.load(f)
+        assert snapshot['version'] == VERSION, (path, snapshot['version'])
+        return snapshot
+
+    def latest_before(self, key: tuple) -> Optional[dict]:
+        """newest snapshot taken before the document of key, key may be only (time,)"""
+        prefix = self.prefix(key)
+        found = None
+        for path in reversed(self.paths()):
+            name = path.name[:len(prefix)]
+            if name > prefix:
+                continue
+            if found and name < self.prefix(found['key']):
+                # snapshots of the same time are not ordered by name
+                break
+            snapshot = self.load(path)
+            if snapshot['key'][:len(key)] < key and (not found or snapshot['key'] > found['key']):
+                found = snapshot
+        return found
+
+    def restore(self, calculator, key: tuple, prune: bool = True) -> Optional[tuple]:
+        """
+        load the newest snapshot before key into calculator and drop the later ones (unless prune is False),
+        they are invalid once documents after the snapshot are processed again.
+        return the key of the last document included in the snapshot.
+        """
+        snapshot = self.latest_before(key)
+        if not snapshot:
+            return None
+        calculator.load_state(snapshot['state'])
+        if prune:
+            self.prune_after(snapshot['key'])
+        return snapshot['key']
+
+    def prune_after(self, key: tuple):
+        prefix = self.prefix(key)
+        for path in self.paths():
+            name = path.name[:len(prefix)]
+            if name > prefix or (name == prefix and self.load(path)['key'] > key):
+                path.unlink()
+
+    def clear(self):
+        for path in self.paths():
+            path.unlink()
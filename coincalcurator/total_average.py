@@ -0,0 +1,36 @@
+import logging
+from pprint import pformat
+from typing import Generator, List
+
+
+class TotalAverageEngine:
+    """
+    total average (総平均法) in one scan of the documents.
+
+    the cost price of a currency is only known after every acquisition of the year,
+    so feed() accumulates ga_costs (calculate_ga_prepare) and keeps the fields
+    calculate_ga needs, and results() values the disposals afterwards.
+    """
+    KEYS = ('time', 'exchange', 'kind', 'id', 'instrument', 'side', 'incomes', 'outcomes', 'fees')
+
+    def __init__(self, calculator):
+        self.calculator = calculator
+        self.pending = []  # type: List[dict]
+
+    def feed(self, doc: dict):
+        result = self.calculator.calculate_ga_prepare(doc)
+        self.pending.append({k: doc[k] for k in self.KEYS if k in doc})
+        return result
+
+    def results(self) -> Generator[dict, None, None]:
+        calculator = self.calculator
+        calculator.pnl = .0
+        pending, self.pending = self.pending, []
+        for doc in pending:
+            try:
+                result = calculator.calculate_ga(doc)
+            except Exception:
+                logging.error(pformat(doc))
+                raise
+            if result:
+                yield result
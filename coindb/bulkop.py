@@ -4,6 +4,8 @@ from typing import Union, Sequence
 from pymongo.collection import Collection
 from pymongo.errors import BulkWriteError
 
+from coinmetrics import metrics
+
 
 class BulkOp:
     LIMIT = 1000
@@ -25,8 +27,10 @@ class BulkOp:
 
     def execute(self):
         if len(self.documents):
+            metrics.count('bulkop.documents', len(self.documents))
             try:
-                self.collection.insert_many(self.documents, ordered=False)
+                with metrics.timer('bulkop.insert_many'):
+                    self.collection.insert_many(self.documents, ordered=False)
             except BulkWriteError as e:
                 for i, error in enumerate(e.details['writeErrors']):
                     if error['code'] != 11000:
@@ -0,0 +1,160 @@
+"""
+named counters and timers to tell network, rate limit sleeps, MongoDB and calculation apart.
+
+nothing is recorded until enable() is called. a disabled count() or timer context costs one flag check,
+a timer decorator also costs a wrapper call, so per-leg hot paths count() inline instead.
+COINMETRICS=1 in the environment enables them for any script and prints a summary to stderr at exit,
+COINMETRICS=path/to/file.json writes the summary as json instead.
+
+    metrics.count('bulkop.documents', n)
+    with metrics.timer('bulkop.execute'):
+        ...
+    @metrics.timer('calculate_ma')
+    def calculate_ma(self, doc): ...
+
+profile(path) runs the rest of the process under cProfile, the --profile option of the scripts.
+max_docs() and scratch_name() are their --max-docs option: a run of a slice of the data writes
+to scratch collections/databases so that it never drops or replaces the real ones.
+"""
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+ENVIRONMENT_VARIABLE = 'COINMETRICS'
+SCRATCH_SUFFIX = '_max_docs'
+
+_enabled = False
+_counters = defaultdict(int)  # type: Dict[str, int]
+_timers = defaultdict(lambda: [0, .0])  # type: Dict[str, list]
+
+
+def enable(path: Optional[str] = None):
+    """record from now on and dump() to path (stderr if None) at exit"""
+    global _enabled
+    if not _enabled:
+        atexit.register(dump, path)
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    _counters.clear()
+    _timers.clear()
+
+
+def count(name: str, n: int = 1):
+    if _enabled:
+        _counters[name] += n
+
+
+def add_time(name: str, seconds: float):
+    if _enabled:
+        entry = _timers[name]
+        entry[0] += 1
+        entry[1] += seconds
+
+
+class Timer:
+    """context manager and decorator adding the elapsed seconds to the timer of name"""
+    __slots__ = ('name', '_start')
+
+    def __init__(self, name: str):
+        self.name = name
+        self._start = None
+
+    def __enter__(self):
+        if _enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._start is not None:
+            add_time(self.name, time.perf_counter() - self._start)
+            self._start = None
+
+    def __call__(self, fn):
+        name = self.name
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add_time(name, time.perf_counter() - start)
+
+        return wrapper
+
+
+def timer(name: str) -> Timer:
+    return Timer(name)
+
+
+def summary() -> dict:
+    return dict(counters={k: _counters[k] for k in sorted(_counters)},
+                timers={k: dict(count=_timers[k][0], seconds=_timers[k][1]) for k in sorted(_timers)})
+
+
+def dump(path: Optional[str] = None):
+    data = summary()
+    if path:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return
+    if not data['counters'] and not data['timers']:
+        return
+    out = sys.stderr
+    print('# metrics', file=out)
+    for name, n in data['counters'].items():
+        print('{:<40} {:>12,}'.format(name, n), file=out)
+    for name, v in data['timers'].items():
+        print('{:<40} {:>12,} {:>12.3f}s {:>10.3f}ms'.format(
+            name, v['count'], v['seconds'], v['seconds'] / v['count'] * 1000), file=out)
+
+
+def profile(path: str):
+    """profile from now on and write the stats to path at exit, read them with python -m pstats path or snakeviz"""
+    profiler = cProfile.Profile()
+    atexit.register(_dump_profile, profiler, path)
+    profiler.enable()
+
+
+def max_docs(value: Optional[str]) -> Optional[int]:
+    """N of --max-docs N, None without the option"""
+    if value is None:
+        return None
+    n = int(value)
+    assert n >= 1, '--max-docs must be at least 1: {}'.format(value)
+    return n
+
+
+def scratch_name(name: str) -> str:
+    """database/collection a --max-docs run writes to instead of name"""
+    return name + SCRATCH_SUFFIX
+
+
+def _dump_profile(profiler: cProfile.Profile, path: str):
+    profiler.disable()
+    profiler.dump_stats(path)
+    print('# profile written to {}'.format(path), file=sys.stderr)
+
+
+_value = os.environ.get(ENVIRONMENT_VARIABLE)
+if _value:
+    enable(None if _value in ('1', '-') else _value)
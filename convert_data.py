@@ -12,6 +12,7 @@ import coinapi
 from coinapi.clientbase import ClientBase
 from coindb import Database
 from coindb.bulkop import BulkOp
+from coinmetrics import metrics
 
 UTC = ClientBase.UTC
 JST = ClientBase.JST
@@ -29,11 +30,19 @@ def main():
         --db DB
         --start START  [default: {start}]
         --stop STOP  [default: {now}]
+        --offline  use cached instruments/currencies regardless of age
+        --refresh-metadata  reload instruments/currencies from exchange
+        --profile FILE  write cProfile stats of the run to FILE, read with python -m pstats FILE
+        --max-docs N  stop after N documents of each collection, to profile a slice of the data.
+                      they are converted into converted_max_docs instead of converted
 
     """.format(f=pathlib.Path(sys.argv[0]).name,
                start=JST.localize(datetime(2016, 12, 29)),
                now=utc_now().astimezone(JST)))
     pprint(args)
+    if args['--profile']:
+        metrics.profile(args['--profile'])
+    max_docs = metrics.max_docs(args['--max-docs'])
     db_client = pymongo.MongoClient()
     db = args['--db']
     start = parse_time(args['--start'])
@@ -43,7 +52,12 @@ def main():
     db = db or exchange
     db = db_client[db]
     client = getattr(coinapi, exchange).Client()  # type: ClientBase
-    client.convert_data_all(db, start, stop, drop=True)
+    if args['--offline']:
+        client.set_metadata_offline()
+    if args['--refresh-metadata']:
+        client.refresh_metadata()
+    out_name = metrics.scratch_name('converted') if max_docs else 'converted'
+    client.convert_data_all(db, start, stop, drop=True, max_docs=max_docs, out_name=out_name)
     adjust_data(db, exchange)
 
 
@@ -12,6 +12,7 @@ from docopt import docopt
 
 from coinapi.clientbase import ClientBase
 from coindb.bulkop import BulkOp
+from coinmetrics import metrics
 
 UTC = ClientBase.UTC
 JST = ClientBase.JST
@@ -28,11 +29,17 @@ def main():
     Options:
         --start START  [default: {start}]
         --stop STOP  [default: {now}]
+        --profile FILE  write cProfile stats of the run to FILE, read with python -m pstats FILE
+        --max-docs N  stop after N documents, to profile a slice of the data.
+                      the candles are written to INSTRUMENT_M1_max_docs instead of INSTRUMENT_M1
 
     """.format(f=pathlib.Path(sys.argv[0]).name,
                start=JST.localize(datetime(2016, 12, 29)),
                now=utc_now().astimezone(JST)))
     pprint(args)
+    if args['--profile']:
+        metrics.profile(args['--profile'])
+    max_docs = metrics.max_docs(args['--max-docs'])
     db_client = pymongo.MongoClient()
     start = parse_time(args['--start'])
     stop = parse_time(args['--stop'])
@@ -42,12 +49,15 @@ def main():
     db = db_client[exchange]
     collection_in = db[instrument]
     collection_out = db['{}_M1'.format(instrument)]
+    if max_docs:
+        collection_out = db[metrics.scratch_name(collection_out.name)]
     collection_out.drop()
     collection_out.create_index([('time', 1)], unique=True)
     candles = OrderedDict()  # type: Dict[datetime, Candle]
     with BulkOp(collection_out) as bulk_op:
         start_1 = start - relativedelta(days=1)
-        for doc in collection_in.find({'time': {'$gt': start_1, '$lt': stop}}, {'_id': 0}).sort('time', 1):
+        for doc in collection_in.find({'time': {'$gt': start_1, '$lt': stop}},
+                                      {'_id': 0}).sort('time', 1).limit(max_docs or 0):
             dt = UTC.localize(doc['time']).astimezone(JST).replace(second=0, microsecond=0)
             if dt not in candles:
                 candles[dt] = Candle(dt)
@@ -9,6 +9,7 @@ from docopt import docopt
 
 import coinapi
 from coinapi.clientbase import ClientBase
+from coinmetrics import metrics
 
 UTC = ClientBase.UTC
 JST = ClientBase.JST
@@ -26,11 +27,19 @@ def main():
         --db DB
         --start START  [default: {start}]
         --stop STOP  [default: {now}]
+        --refresh-metadata  reload instruments/currencies from exchange
+        --legacy-id  make record ids with json_hash() as older databases did
+        --profile FILE  write cProfile stats of the run to FILE, read with python -m pstats FILE
+        --max-docs N  stop after N documents of each import method, to profile a slice of the data.
+                      they are imported into DB_max_docs instead of DB
 
     """.format(f=pathlib.Path(sys.argv[0]).name,
                start=JST.localize(datetime(2016, 12, 29)),
                now=utc_now().astimezone(JST)))
     pprint(args)
+    if args['--profile']:
+        metrics.profile(args['--profile'])
+    max_docs = metrics.max_docs(args['--max-docs'])
     db_client = pymongo.MongoClient()
     db = args['--db']
     start = parse_time(args['--start'])
@@ -38,9 +47,15 @@ def main():
 
     exchange = args['EXCHANGE']
     db = db or exchange
+    if max_docs:
+        db = metrics.scratch_name(db)
     db = db_client[db]
     client = getattr(coinapi, exchange).Client()  # type: ClientBase
-    client.import_data_all(db, start, stop, drop=True)
+    if args['--refresh-metadata']:
+        client.refresh_metadata()
+    if args['--legacy-id']:
+        type(client).LEGACY_RECORD_ID = True
+    client.import_data_all(db, start, stop, drop=True, max_docs=max_docs)
 
 
 if __name__ == '__main__':
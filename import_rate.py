@@ -1,3 +1,4 @@
+import itertools
 import logging
 import pathlib
 import re
@@ -14,6 +15,7 @@ from docopt import docopt
 import coinapi
 from coinapi.clientbase import ClientBase
 from coindb.bulkop import BulkOp
+from coinmetrics import metrics
 
 UTC = ClientBase.UTC
 JST = ClientBase.JST
@@ -31,11 +33,17 @@ def main():
         --db DB
         --start START  [default: {start}]
         --stop STOP  [default: {now}]
+        --profile FILE  write cProfile stats of the run to FILE, read with python -m pstats FILE
+        --max-docs N  stop after N documents, to profile a slice of the data.
+                      they are imported into INSTRUMENT_max_docs instead of INSTRUMENT
 
     """.format(f=pathlib.Path(sys.argv[0]).name,
                start=JST.localize(datetime(2016, 12, 29)),
                now=utc_now().astimezone(JST)))
     pprint(args)
+    if args['--profile']:
+        metrics.profile(args['--profile'])
+    max_docs = metrics.max_docs(args['--max-docs'])
     db_client = pymongo.MongoClient()
     db = args['--db']
     start = parse_time(args['--start'])
@@ -49,7 +57,7 @@ def main():
         client = getattr(coinapi, exchange).Client()  # type: ClientBase
     db = db or exchange
     db = db_client[db]
-    collection = db[instrument]
+    collection = db[metrics.scratch_name(instrument) if max_docs else instrument]
     params = dict(map(lambda s: s.split('='), args['PARAM']))
     with BulkOp(collection) as bulk_op:
         collection.create_index([
@@ -64,7 +72,7 @@ def main():
             except StopIteration:
                 gen = client.public_executions_desc(instrument, start, stop, **params)
 
-        for data in gen:
+        for data in itertools.islice(gen, max_docs):
             bulk_op.insert(data)
 
 
@@ -3,11 +3,12 @@ from setuptools import setup
 setup(
     name='cointax',
     version='',
-    packages=['coindb', 'coinapi'],
+    packages=['coindb', 'coinapi', 'coinmetrics'],
     url='',
     license='',
     author='tetocode',
     author_email='',
     description='',
-    install_requires=['ccxt', 'pandas', 'python-dateutil', 'pytz', 'PyYAML', 'pymongo', 'requests']
+    install_requires=['ccxt', 'pandas', 'python-dateutil', 'pytz', 'PyYAML', 'pymongo', 'requests'],
+    extras_require={'columnar': ['pyarrow']},
 )